@@ -2,16 +2,17 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 import jwt
-import os
-from dotenv import load_dotenv
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, SECRET_KEY
 
-load_dotenv()
-
-SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# Dedicated pool so password hashing never runs on, or starves, the event loop
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 def hash_password(password: str):
     return pwd_context.hash(password)
@@ -19,6 +20,16 @@ def hash_password(password: str):
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str):
+    """Hash a password on the bcrypt pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, hash_password, password)
+
+async def verify_and_update_password(plain_password, hashed_password):
+    """Verify on the bcrypt pool; returns (valid, new_hash) where new_hash is set when the cost changed."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict):
     return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
 
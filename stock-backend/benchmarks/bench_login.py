@@ -0,0 +1,79 @@
+"""Login hashing benchmark: bcrypt on the event loop vs. on the auth hash pool.
+
+Run from stock-backend/:
+
+    python -m benchmarks.bench_login [--logins 32] [--rounds 12]
+
+Simulates a login storm of concurrent password verifications while a probe
+coroutine measures how late a 10 ms timer fires, i.e. what every other request
+and WebSocket send on the worker would experience.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+PROBE_INTERVAL = 0.01
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def probe(stop: asyncio.Event, lags: list):
+    """Record how late each 10 ms sleep wakes up."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+
+async def storm(login, logins: int):
+    stop = asyncio.Event()
+    lags = []
+    probe_task = asyncio.create_task(probe(stop, lags))
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe_task
+    lags = lags or [elapsed * 1000]
+    return {
+        "logins_per_sec": round(logins / elapsed, 1),
+        "loop_lag_p50_ms": round(statistics.median(lags), 2),
+        "loop_lag_p99_ms": round(percentile(lags, 99), 2),
+        "loop_lag_max_ms": round(max(lags), 2),
+    }
+
+
+async def main(logins: int):
+    import auth
+
+    hashed = auth.hash_password("correct horse battery staple")
+
+    async def on_loop():
+        # Previous behaviour: bcrypt inside the async handler
+        auth.verify_password("correct horse battery staple", hashed)
+        await asyncio.sleep(0)
+
+    async def on_pool():
+        await auth.verify_and_update_password("correct horse battery staple", hashed)
+
+    print(f"bcrypt rounds={auth.BCRYPT_ROUNDS} pool workers={auth.PASSWORD_HASH_WORKERS} logins={logins}")
+    for name, login in (("event loop", on_loop), ("hash pool", on_pool)):
+        print(f"{name:>10}: {await storm(login, logins)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="bcrypt login storm benchmark")
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--rounds", type=int, help="Override BCRYPT_ROUNDS")
+    args = parser.parse_args()
+    if args.rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    asyncio.run(main(args.logins))
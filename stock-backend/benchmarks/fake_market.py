@@ -0,0 +1,86 @@
+"""Local stand-in for the Finnhub REST API.
+
+Run from stock-backend/:
+
+    python -m benchmarks.fake_market [--port 9100] [--latency-ms 20] [--error-rate 0]
+
+then start the API with FINNHUB_BASE_URL=http://127.0.0.1:9100/api/v1.
+Serves /quote (random-walk prices), /stock/profile2 and /stock/symbol with
+a configurable delay so runs are repeatable and never touch the real quota.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+SYMBOL_COUNT = 5000
+
+
+def create_app(latency: float, error_rate: float, seed: int = 42) -> Starlette:
+    rng = random.Random(seed)
+    prices = {}
+    symbols = [f"SYM{i:04d}" for i in range(SYMBOL_COUNT)]
+    stats = {"requests": 0, "errors": 0}
+
+    async def delay():
+        stats["requests"] += 1
+        if latency:
+            # +/-50% jitter around the configured upstream latency
+            await asyncio.sleep(latency * (0.5 + rng.random()))
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": "simulated upstream failure"}, status_code=503)
+        return None
+
+    async def quote(request):
+        failure = await delay()
+        if failure:
+            return failure
+        symbol = request.query_params.get("symbol", "")
+        previous_close = prices.setdefault(symbol, 50 + rng.random() * 450)
+        price = round(previous_close * (1 + rng.uniform(-0.02, 0.02)), 2)
+        return JSONResponse({
+            "c": price, "d": round(price - previous_close, 2),
+            "dp": round((price - previous_close) / previous_close * 100, 4),
+            "h": price, "l": price, "o": previous_close, "pc": round(previous_close, 2),
+            "t": int(time.time()),
+        })
+
+    async def profile(request):
+        failure = await delay()
+        if failure:
+            return failure
+        symbol = request.query_params.get("symbol", "")
+        return JSONResponse({"ticker": symbol, "logo": f"https://logo.example/{symbol}.png"})
+
+    async def symbol_list(request):
+        failure = await delay()
+        if failure:
+            return failure
+        return JSONResponse([
+            {"symbol": symbol, "description": f"{symbol} Corp", "type": "Common Stock", "currency": "USD"}
+            for symbol in symbols
+        ])
+
+    async def get_stats(request):
+        return JSONResponse(stats)
+
+    return Starlette(routes=[
+        Route("/api/v1/quote", quote),
+        Route("/api/v1/stock/profile2", profile),
+        Route("/api/v1/stock/symbol", symbol_list),
+        Route("/stats", get_stats),
+    ])
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--port", type=int, default=9100)
+    arg_parser.add_argument("--latency-ms", type=float, default=20, help="Mean simulated upstream latency")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    args = arg_parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms / 1000, args.error_rate), host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,73 @@
+"""Local stand-in for the Finnhub websocket trade feed.
+
+Run from stock-backend/:
+
+    python -m benchmarks.fake_trade_stream [--port 8765] [--rate 50]
+
+then start the API with TICK_SOURCE=stream FINNHUB_WS_URL=ws://localhost:8765.
+Speaks the same protocol as wss://ws.finnhub.io: clients send
+{"type": "subscribe"|"unsubscribe", "symbol": ...} and receive
+{"type": "trade", "data": [{"s", "p", "t", "v"}, ...]} bursts plus periodic pings.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import websockets
+
+
+async def serve_client(websocket, rate: float, burst: int):
+    subscribed = set()
+    prices = {}
+
+    async def read():
+        async for message in websocket:
+            request = json.loads(message)
+            symbol = request.get("symbol")
+            if request.get("type") == "subscribe" and symbol:
+                subscribed.add(symbol)
+                prices.setdefault(symbol, 100 + random.random() * 400)
+            elif request.get("type") == "unsubscribe":
+                subscribed.discard(symbol)
+
+    reader = asyncio.create_task(read())
+    last_ping = time.monotonic()
+    try:
+        while not reader.done():
+            await asyncio.sleep(1 / rate)
+            if subscribed:
+                trades = []
+                for _ in range(burst):
+                    symbol = random.choice(list(subscribed))
+                    prices[symbol] *= 1 + random.uniform(-0.001, 0.001)
+                    trades.append({
+                        "s": symbol,
+                        "p": round(prices[symbol], 2),
+                        "t": int(time.time() * 1000),
+                        "v": random.randint(1, 500)
+                    })
+                await websocket.send(json.dumps({"type": "trade", "data": trades}))
+            if time.monotonic() - last_ping > 10:
+                await websocket.send(json.dumps({"type": "ping"}))
+                last_ping = time.monotonic()
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        reader.cancel()
+
+
+async def main(host: str, port: int, rate: float, burst: int):
+    async with websockets.serve(lambda ws: serve_client(ws, rate, burst), host, port):
+        print(f"Fake trade stream on ws://{host}:{port} ({rate} msgs/s, {burst} trades/msg)")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Finnhub trade stream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=50, help="Messages per second")
+    parser.add_argument("--burst", type=int, default=5, help="Trades per message")
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.rate, args.burst))
@@ -0,0 +1,81 @@
+"""Check that `import main` stays under a time budget and leaves heavy dependencies unloaded.
+
+Run from stock-backend/:
+
+    python -m benchmarks.import_budget [--budget-ms 1000] [--runs 5] [--top 15]
+
+Each run imports main in a fresh interpreter, so nothing is served from an already
+warm sys.modules. Exits 1 if the median import time exceeds the budget or if any of
+LAZY_MODULES got imported; --top lists the slowest top-level imports (-X importtime)
+to show where a regression came from.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed by history charts and analytics; must be imported on first use
+LAZY_MODULES = ("numpy", "pandas", "yfinance", "portfolio_analytics", "history_store")
+
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+print(json.dumps({{
+    "ms": (time.perf_counter() - started) * 1000,
+    "loaded": [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def run_probe() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(count: int) -> list:
+    """(cumulative microseconds, module) for the slowest imports directly under main."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Depth is encoded as two spaces per level after the first space
+        if cumulative.strip().isdigit() and len(name) - len(name.lstrip()) <= 3:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--budget-ms", type=float, default=1000)
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    args = arg_parser.parse_args()
+
+    probes = [run_probe() for _ in range(args.runs)]
+    median = statistics.median(probe["ms"] for probe in probes)
+    loaded = sorted({name for probe in probes for name in probe["loaded"]})
+
+    print(f"import main: median {median:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    if args.top:
+        for cumulative, name in slowest_imports(args.top):
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"median import time {median:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    if loaded:
+        failures.append(f"imported eagerly: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
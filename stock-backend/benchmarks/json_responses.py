@@ -0,0 +1,176 @@
+"""Compare FastAPI's default JSON rendering with the orjson FastJSONResponse on large payloads.
+
+Run from stock-backend/:
+
+    python -m benchmarks.json_responses [--requests 300]
+
+Each payload is served twice by a throwaway FastAPI app, called directly as an
+ASGI application. "before" returns the content the way routes used to: through
+jsonable_encoder and json.dumps, with /api/news validated again via response_model.
+"after" returns FastJSONResponse directly, as the routes now do. No database or
+upstream is involved, so only request handling and serialization are measured.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from responses import FastJSONResponse
+from routes.trading import MAX_HISTORY_LIMIT, NewsArticle
+
+
+def trade_history_page() -> dict:
+    """A full /trading/history page."""
+    now = datetime.utcnow()
+    return {
+        "trade_history": [
+            {
+                "order_id": str(ObjectId()),
+                "action": random.choice(("buy", "sell")),
+                "symbol": f"SYM{random.randrange(500):04d}",
+                "quantity": random.randint(1, 100),
+                "price": round(random.uniform(5, 500), 2),
+                "timestamp": now - timedelta(minutes=i),
+            }
+            for i in range(MAX_HISTORY_LIMIT)
+        ],
+        "next_cursor": "cursor",
+    }
+
+
+def symbol_list(count: int) -> list:
+    """Rows shaped like /stocks/get/symbols results."""
+    return [
+        {"symbol": f"SYM{i:04d}", "exchange": "US", "description": f"SYM{i:04d} Holdings Corp", "type": "Common Stock"}
+        for i in range(count)
+    ]
+
+
+def portfolio_value(positions: int) -> dict:
+    stocks = [
+        {
+            "symbol": f"SYM{i:04d}", "quantity": 10, "price": 123.45, "total_value": 1234.5,
+            "logo": f"https://logo.example/SYM{i:04d}.png", "cached": True, "price_age": 0.5,
+        }
+        for i in range(positions)
+    ]
+    return {"total_portfolio_value": 1234.5 * positions, "stocks": stocks}
+
+
+def history_chart(days: int) -> dict:
+    start = datetime(2024, 1, 1)
+    return {"data": [
+        {"date": (start + timedelta(days=i)).strftime("%Y-%m-%d"), "close": 100 + i * 0.1}
+        for i in range(days)
+    ]}
+
+
+def news_articles(count: int) -> List[dict]:
+    return [
+        NewsArticle(
+            title=f"Headline {i}", link=f"https://news.example/{i}", description="Lorem ipsum " * 20,
+            pubDate=datetime(2024, 1, 1, 12, 0, 0), source="example", image_url=None,
+        ).model_dump()
+        for i in range(count)
+    ]
+
+
+PAYLOADS = {
+    f"trade_history_{MAX_HISTORY_LIMIT}": trade_history_page(),
+    "symbols_100": symbol_list(100),
+    "symbols_5000": symbol_list(5000),
+    "portfolio_value_50": portfolio_value(50),
+    "history_chart_1y": history_chart(365),
+}
+NEWS = news_articles(50)
+
+
+def endpoints(payload):
+    """(before, after) handlers for one payload; no parameters, so FastAPI validates nothing on the way in."""
+    async def before():
+        return payload
+
+    async def after():
+        return FastJSONResponse(payload)
+
+    return before, after
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    for name, payload in PAYLOADS.items():
+        before, after = endpoints(payload)
+        app.add_api_route(f"/before/{name}", before, response_class=JSONResponse)
+        app.add_api_route(f"/after/{name}", after)
+
+    @app.get("/before/news_50", response_model=List[NewsArticle], response_class=JSONResponse)
+    async def news_before():
+        return NEWS
+
+    @app.get("/after/news_50", responses={200: {"model": List[NewsArticle]}})
+    async def news_after():
+        return FastJSONResponse(NEWS)
+
+    return app
+
+
+async def call(app, path: str) -> int:
+    """One GET straight through the ASGI app; returns the body size.
+
+    Calling the app directly keeps an HTTP client's own parsing and copying out of the timings.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status, size = 0, 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"GET {path} returned {status}")
+    return size
+
+
+async def measure(app, path: str, requests: int):
+    # Warm up route and encoder caches
+    for _ in range(5):
+        await call(app, path)
+    samples = []
+    size = 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        size = await call(app, path)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, size
+
+
+async def main(requests: int):
+    app = create_app()
+    print(f"{'payload':<22}{'bytes':>10}{'before ms':>12}{'after ms':>11}{'speedup':>10}")
+    for name in list(PAYLOADS) + ["news_50"]:
+        before, size = await measure(app, f"/before/{name}", requests)
+        after, _ = await measure(app, f"/after/{name}", requests)
+        print(f"{name:<22}{size:>10}{before:>12.2f}{after:>11.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--requests", type=int, default=300, help="Requests per payload and variant")
+    asyncio.run(main(arg_parser.parse_args().requests))
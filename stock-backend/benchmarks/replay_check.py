@@ -0,0 +1,132 @@
+"""Check portfolio_analytics.replay against a plain per-share reference on random trade histories.
+
+Run from stock-backend/:
+
+    python -m benchmarks.replay_check [--histories 200] [--trades 3000] [--seed 0]
+
+Histories mix buys, sells that take most of a position without closing it, full
+closes, and long runs of selling half the position. Each history is replayed in one
+pass and again in random slices (the way settled trades are folded into the stored
+snapshot), and both must match the reference on quantity, cost basis, realized P&L
+and every end-of-day step. Exits 1 on the first mismatch.
+"""
+import argparse
+import math
+import random
+import sys
+from portfolio_analytics import replay
+
+SYMBOLS = ("AAPL", "MSFT", "TSLA")
+
+
+def reference(trades: list) -> dict:
+    """Average price per share, updated one trade at a time; returns symbol -> final state and day steps."""
+    state = {}
+    for trade in trades:
+        position = state.setdefault(trade["symbol"], {"held": 0, "average": 0.0, "realized": 0.0, "steps": {}})
+        if trade["action"] == "buy":
+            held = position["held"] + trade["quantity"]
+            position["average"] = (position["average"] * position["held"] + trade["quantity"] * trade["price"]) / held
+            position["held"] = held
+        else:
+            position["realized"] += trade["quantity"] * (trade["price"] - position["average"])
+            position["held"] -= trade["quantity"]
+            if position["held"] == 0:
+                position["average"] = 0.0
+        position["steps"][trade["day"]] = (
+            position["held"], position["average"] * position["held"], position["realized"],
+        )
+    return state
+
+
+def random_history(rng: random.Random, count: int) -> list:
+    held = dict.fromkeys(SYMBOLS, 0)
+    trades = []
+    day = 19000
+    while len(trades) < count:
+        day += rng.random() < 0.3
+        symbol = rng.choice(SYMBOLS)
+        price = round(rng.uniform(1, 1000), 2)
+        mode = rng.random()
+        if held[symbol] == 0 or mode < 0.4:
+            quantity = rng.randint(1, 10000)
+            action = "buy"
+        elif mode < 0.6:
+            quantity, action = held[symbol], "sell"
+        elif mode < 0.8:
+            # Most of the position, never all of it
+            quantity, action = max(1, held[symbol] - rng.randint(1, 3)), "sell"
+            if quantity >= held[symbol]:
+                continue
+        else:
+            quantity, action = rng.randint(1, held[symbol]), "sell"
+        held[symbol] += quantity if action == "buy" else -quantity
+        trades.append({"symbol": symbol, "action": action, "quantity": quantity, "price": price, "day": day})
+    return trades
+
+
+def halving_history(cycles: int) -> list:
+    """One large buy, then `cycles` sells of half the position (topped up so it never closes)."""
+    trades = [{"symbol": "HALF", "action": "buy", "quantity": 2 ** 20, "price": 10.0, "day": 19000}]
+    held = 2 ** 20
+    for i in range(cycles):
+        if held < 2:
+            trades.append({"symbol": "HALF", "action": "buy", "quantity": 2 ** 20, "price": 5.0 + i % 7, "day": 19000 + i})
+            held += 2 ** 20
+        trades.append({"symbol": "HALF", "action": "sell", "quantity": held // 2, "price": 12.0, "day": 19000 + i})
+        held -= held // 2
+    return trades
+
+
+def close(a: float, b: float) -> bool:
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def compare(positions: dict, expected: dict) -> list:
+    problems = []
+    for symbol, want in expected.items():
+        got = positions[symbol]
+        final = (want["held"], want["average"] * want["held"], want["realized"])
+        if got["quantity"] != want["held"] or not close(got["cost"], final[1]) or not close(got["realized"], final[2]):
+            problems.append(f"{symbol}: got {(got['quantity'], got['cost'], got['realized'])}, expected {final}")
+        steps = dict(zip(got["days"], zip(got["held"], got["costs"], got["realized_steps"])))
+        if list(steps) != list(want["steps"]) or len(steps) != len(got["days"]):
+            problems.append(f"{symbol}: end-of-day steps on the wrong days")
+            continue
+        for day, step in want["steps"].items():
+            if not all(close(a, b) for a, b in zip(steps[day], step)):
+                problems.append(f"{symbol}: step on day {day} is {steps[day]}, expected {step}")
+                break
+    return problems
+
+
+def check(trades: list, rng: random.Random) -> list:
+    expected = reference(trades)
+    problems = compare(replay({}, trades), expected)
+
+    positions, start = {}, 0
+    while start < len(trades):
+        end = start + rng.randint(1, max(1, len(trades) // 5))
+        positions = replay(positions, trades[start:end])
+        start = end
+    return problems + [f"sliced: {problem}" for problem in compare(positions, expected)]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--histories", type=int, default=200)
+    arg_parser.add_argument("--trades", type=int, default=3000, help="Trades per random history")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = [("halving", halving_history(1200))]
+    cases += [(f"random {i}", random_history(rng, args.trades)) for i in range(args.histories)]
+    for name, trades in cases:
+        problems = check(trades, rng)
+        if problems:
+            print(f"FAIL {name} ({len(trades)} trades):")
+            for problem in problems[:10]:
+                print(f"  {problem}")
+            sys.exit(1)
+    print(f"OK: {len(cases)} histories match the sequential reference")
@@ -0,0 +1,320 @@
+"""End-to-end benchmark suite against local stand-ins for Finnhub and MongoDB.
+
+Run from stock-backend/:
+
+    python -m benchmarks.run_suite [--scenarios login,portfolio,trade,ws] [--save-baseline]
+    python -m benchmarks.run_suite --compare benchmarks/baselines/baseline.json
+
+Starts benchmarks.fake_market, benchmarks.fake_trade_stream (with the default
+--tick-source stream) and benchmarks.serve (the real `main.app` under uvicorn)
+as subprocesses, then drives:
+
+  login      concurrent /users/login storm (bcrypt on the hash pool)
+  portfolio  /portfolio/value for seeded multi-symbol portfolios
+  trade      bursts of /trading/trade buys
+  ws         N /ws clients subscribed to M symbols each; frame delivery lag
+             and the emitter tick time read from /metrics
+
+Every run writes its results to benchmarks/results/; --save-baseline also
+stores them as the baseline, and --compare flags p50/p99/throughput changes
+beyond --tolerance. Upstream rate limiting is lifted so the service itself is
+measured, not the Finnhub plan. With the in-memory Mongo stand-in the trade
+scenario's pipeline updates are emulated by mongomock, so compare trade
+numbers only between runs against the same backend (see --mongo-uri).
+--tick-source poll measures REST polling instead of the trade stream; every
+tick then quotes each watched symbol, which on a small machine takes longer
+than the tick interval with the default client count.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+import httpx
+import websockets
+from benchmarks.serve import BENCH_PASSWORD, bench_email, bench_symbols
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(HERE, "results")
+DEFAULT_BASELINE = os.path.join(HERE, "baselines", "baseline.json")
+SCENARIOS = ("login", "portfolio", "trade", "ws")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies: list, elapsed: float, errors: int = 0) -> dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+
+async def run_load(send, total: int, concurrency: int) -> dict:
+    """Issue `total` calls of `send(i)` with at most `concurrency` in flight."""
+    latencies, errors = [], 0
+    next_index = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            started = time.perf_counter()
+            try:
+                ok = await send(i)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += 0 if ok else 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def login_tokens(client: httpx.AsyncClient, count: int) -> list:
+    async def login(i):
+        response = await client.post("/users/login", json={"email": bench_email(i), "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    return await asyncio.gather(*(login(i) for i in range(count)))
+
+
+async def scenario_login(client, args, tokens) -> dict:
+    async def send(i):
+        response = await client.post("/users/login", json={"email": bench_email(i % args.users), "password": BENCH_PASSWORD})
+        return response.status_code == 200
+
+    return await run_load(send, args.login_requests, args.concurrency)
+
+
+async def scenario_portfolio(client, args, tokens) -> dict:
+    async def send(i):
+        token = tokens[i % len(tokens)]
+        response = await client.get("/portfolio/value", headers={"Authorization": f"Bearer {token}"})
+        return response.status_code == 200
+
+    return await run_load(send, args.requests, args.concurrency)
+
+
+async def scenario_trade(client, args, tokens) -> dict:
+    symbols = bench_symbols(args.symbols)
+
+    async def send(i):
+        token = tokens[i % len(tokens)]
+        response = await client.post(
+            "/trading/trade", params={"action": "buy"},
+            json={"symbol": random.choice(symbols), "quantity": 1},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        return response.status_code == 200
+
+    results = await run_load(send, args.requests, args.concurrency)
+
+    # A backend that misapplies the pipeline update leaves positions without a symbol or quantity
+    malformed = 0
+    for token in tokens:
+        response = await client.get("/portfolio/", headers={"Authorization": f"Bearer {token}"})
+        positions = response.json().get("portfolio", []) if response.status_code == 200 else []
+        malformed += sum(1 for position in positions if not {"symbol", "quantity"} <= set(position))
+    results["malformed_positions"] = malformed
+    return results
+
+
+def parse_histogram(metrics_text: str, name: str):
+    """(sum, count) of an unlabelled histogram from Prometheus text."""
+    total = count = 0.0
+    for line in metrics_text.splitlines():
+        if line.startswith(f"{name}_sum"):
+            total = float(line.rsplit(" ", 1)[1])
+        elif line.startswith(f"{name}_count"):
+            count = float(line.rsplit(" ", 1)[1])
+    return total, count
+
+
+async def scenario_ws(client, args, tokens) -> dict:
+    symbols = bench_symbols(args.symbols)
+    url = f"ws://127.0.0.1:{args.port}/ws"
+    lags, frames = [], 0
+    stop = asyncio.Event()
+
+    async def viewer():
+        nonlocal frames
+        async with websockets.connect(url, max_queue=None) as websocket:
+            await websocket.send(json.dumps({"action": "subscribe", "symbols": random.sample(symbols, args.ws_symbols)}))
+            while not stop.is_set():
+                try:
+                    message = json.loads(await asyncio.wait_for(websocket.recv(), 0.5))
+                except asyncio.TimeoutError:
+                    continue
+                if message.get("event") == "stock_updates":
+                    frames += 1
+                    tick_time = datetime.fromisoformat(message["data"][0]["time"])
+                    lags.append((datetime.now() - tick_time).total_seconds())
+
+    before_sum, before_count = parse_histogram((await client.get("/metrics")).text, "emitter_tick_duration_seconds")
+    tasks = [asyncio.create_task(viewer()) for _ in range(args.ws_clients)]
+    started = time.perf_counter()
+    await asyncio.sleep(args.ws_seconds)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    after_sum, after_count = parse_histogram((await client.get("/metrics")).text, "emitter_tick_duration_seconds")
+
+    ticks = after_count - before_count
+    return {
+        "clients": args.ws_clients,
+        "frames": frames,
+        "frames_per_second": round(frames / elapsed, 1),
+        "delivery_lag_p50_ms": round(percentile(lags, 50) * 1000, 2) if lags else None,
+        "delivery_lag_p99_ms": round(percentile(lags, 99) * 1000, 2) if lags else None,
+        "emitter_ticks": int(ticks),
+        "emitter_tick_mean_ms": round((after_sum - before_sum) / ticks * 1000, 2) if ticks else None,
+    }
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("API did not start; run benchmarks.serve directly to see its output")
+
+
+def start_processes(args) -> list:
+    env = dict(
+        os.environ,
+        FINNHUB_BASE_URL=f"http://127.0.0.1:{args.market_port}/api/v1",
+        # Measure the service, not the upstream plan budget
+        FINNHUB_CALLS_PER_MINUTE="6000000",
+        FINNHUB_BURST="100000",
+        BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+        TICK_SOURCE=args.tick_source,
+        FINNHUB_WS_URL=f"ws://127.0.0.1:{args.stream_port}",
+    )
+    processes = [subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_market", "--port", str(args.market_port), "--latency-ms", str(args.latency_ms)],
+        env=env,
+    )]
+    if args.tick_source == "stream":
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_trade_stream", "--port", str(args.stream_port)], env=env,
+        ))
+    serve_cmd = [
+        sys.executable, "-m", "benchmarks.serve", "--port", str(args.port),
+        "--users", str(args.users), "--symbols", str(args.symbols),
+    ]
+    if args.mongo_uri:
+        serve_cmd += ["--mongo-uri", args.mongo_uri]
+    processes.append(subprocess.Popen(serve_cmd, env=env))
+    return processes
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lines describing metrics that moved beyond `tolerance` (as a fraction) versus the baseline."""
+    worse_if_higher = ("p50_ms", "p99_ms", "delivery_lag_p50_ms", "delivery_lag_p99_ms", "emitter_tick_mean_ms")
+    worse_if_lower = ("throughput_rps", "frames_per_second")
+    lines = []
+    for scenario, metrics in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base:
+            continue
+        for key, value in metrics.items():
+            old = base.get(key)
+            if not old or value is None or key not in worse_if_higher + worse_if_lower:
+                continue
+            change = (value - old) / old
+            regressed = change > tolerance if key in worse_if_higher else change < -tolerance
+            improved = change < -tolerance if key in worse_if_higher else change > tolerance
+            if regressed or improved:
+                label = "REGRESSION" if regressed else "improved"
+                lines.append(f"{label:>10}  {scenario}.{key}: {old} -> {value} ({change:+.0%})")
+    return lines
+
+
+async def main(args):
+    processes = start_processes(args)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60) as client:
+            await wait_until_up(client)
+            await asyncio.sleep(args.warmup)
+            tokens = await login_tokens(client, min(args.users, 50))
+
+            runners = {"login": scenario_login, "portfolio": scenario_portfolio, "trade": scenario_trade, "ws": scenario_ws}
+            results = {
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "config": {key: value for key, value in vars(args).items() if key not in ("compare", "save_baseline")},
+                # The load generator, API and stand-ins share this machine
+                "cpus": os.cpu_count(),
+                "scenarios": {},
+            }
+            for name in args.scenarios.split(","):
+                print(f"Running {name}...", flush=True)
+                results["scenarios"][name] = await runners[name](client, args, tokens)
+                print(f"  {json.dumps(results['scenarios'][name])}", flush=True)
+    finally:
+        # API first, so its background tasks never see the upstream disappear
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"run-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            lines = compare(results, json.load(f), args.tolerance)
+        print("\n".join(lines) if lines else f"No changes beyond {args.tolerance:.0%} versus {args.compare}")
+        if any(line.lstrip().startswith("REGRESSION") for line in lines):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    arg_parser.add_argument("--requests", type=int, default=500, help="Requests per HTTP scenario")
+    arg_parser.add_argument("--login-requests", type=int, default=100, help="Logins in the login storm (each costs a bcrypt verify)")
+    arg_parser.add_argument("--concurrency", type=int, default=32)
+    arg_parser.add_argument("--users", type=int, default=200)
+    arg_parser.add_argument("--symbols", type=int, default=500)
+    arg_parser.add_argument("--ws-clients", type=int, default=200)
+    arg_parser.add_argument("--ws-symbols", type=int, default=10, help="Symbols each WebSocket client subscribes to")
+    arg_parser.add_argument("--ws-seconds", type=float, default=10)
+    arg_parser.add_argument("--latency-ms", type=float, default=20, help="Simulated upstream latency")
+    arg_parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    arg_parser.add_argument("--warmup", type=float, default=2, help="Seconds to let startup tasks settle")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--market-port", type=int, default=9100)
+    arg_parser.add_argument("--tick-source", choices=("stream", "poll"), default="stream", help="How the API gets tick prices")
+    arg_parser.add_argument("--stream-port", type=int, default=8765)
+    arg_parser.add_argument("--mongo-uri", default=None, help="Run against a real MongoDB instead of mongomock")
+    arg_parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    arg_parser.add_argument("--save-baseline", action="store_true")
+    arg_parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change reported as a regression")
+    asyncio.run(main(arg_parser.parse_args()))
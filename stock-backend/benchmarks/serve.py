@@ -0,0 +1,137 @@
+"""Run the API against local stand-ins, with seeded benchmark users.
+
+Run from stock-backend/, after `pip install -r benchmarks/requirements.txt`:
+
+    FINNHUB_BASE_URL=http://127.0.0.1:9100/api/v1 python -m benchmarks.serve [--port 8000] [--users 200]
+
+Without --mongo-uri the app's collections are bound to an in-memory
+mongomock_motor database before main is imported, with the few gaps the trade
+pipeline hits patched (see patch_mongomock). With --mongo-uri (e.g. a local
+mongod) the real driver is used; only @bench.local users and the SYM####
+symbols are replaced when seeding.
+
+The stand-in needs mongomock and mongomock_motor, pinned in benchmarks/requirements.txt
+because patch_mongomock reaches into mongomock's private parser and bulk builder.
+"""
+import argparse
+import logging
+import os
+import random
+import uvicorn
+
+BENCH_EMAIL_DOMAIN = "bench.local"
+BENCH_PASSWORD = "bench-password"
+
+
+def bench_email(i: int) -> str:
+    return f"user{i}@{BENCH_EMAIL_DOMAIN}"
+
+
+def bench_symbols(count: int) -> list:
+    return [f"SYM{i:04d}" for i in range(count)]
+
+
+def patch_mongomock():
+    """Fill the mongomock gaps the trade routes run into, so the stand-in applies them like mongod.
+
+    - Array literals inside expressions are returned verbatim, so `[{"$literal": doc}]` in
+      $concatArrays stored the operator itself instead of `doc`; evaluate their elements.
+    - $mergeObjects is only implemented as a $group accumulator; add it as an expression.
+    - bulk_write passes the `sort` option pymongo 4.11 adds to UpdateOne/ReplaceOne, which
+      mongomock's bulk builder does not accept; drop it (the app never sets it).
+
+    Written against mongomock 4.3.0 (benchmarks/requirements.txt).
+    """
+    from mongomock import aggregate, collection
+
+    parser = aggregate._Parser
+    parse_basic, parse = parser._parse_basic_expression, parser.parse
+
+    def parse_basic_expression(self, expression):
+        if isinstance(expression, list):
+            return [self.parse(item) for item in expression]
+        return parse_basic(self, expression)
+
+    def parse_expression(self, expression):
+        if isinstance(expression, dict) and list(expression) == ["$mergeObjects"]:
+            merged = {}
+            for value in self.parse_many(expression["$mergeObjects"]):
+                merged.update(value or {})
+            return merged
+        return parse(self, expression)
+
+    parser._parse_basic_expression = parse_basic_expression
+    parser.parse = parse_expression
+
+    builder = collection.BulkOperationBuilder
+    for name in ("add_update", "add_replace"):
+        def without_sort(self, *args, _add=getattr(builder, name), sort=None, **kwargs):
+            return _add(self, *args, **kwargs)
+        setattr(builder, name, without_sort)
+
+
+def install_mongo_stand_in():
+    """Connect `database` to an in-memory mongomock_motor client; the startup hook then keeps it."""
+    from mongomock_motor import AsyncMongoMockClient
+    import database
+
+    patch_mongomock()
+    database.connect_mongo(AsyncMongoMockClient())
+
+
+def make_seeder(users: int, holdings: int, symbols: int):
+    async def seed():
+        import database
+        from auth import hash_password
+
+        database.connect_mongo()  # Runs before the app's own startup hook
+        universe = bench_symbols(symbols)
+        await database.stock_symbols_collection.delete_many({"symbol": {"$in": universe}})
+        await database.stock_symbols_collection.insert_many([
+            {"symbol": symbol, "description": f"{symbol} Corp", "exchange": "US", "type": "Common Stock"}
+            for symbol in universe
+        ])
+
+        # One hash for everyone: seeding should not take users * bcrypt time
+        password = hash_password(BENCH_PASSWORD)
+        rng = random.Random(7)
+        await database.users_collection.delete_many({"email": {"$regex": f"@{BENCH_EMAIL_DOMAIN}$"}})
+        await database.users_collection.insert_many([
+            {
+                "username": f"bench{i}",
+                "email": bench_email(i),
+                "password": password,
+                "portfolio": [
+                    {"symbol": symbol, "quantity": rng.randint(1, 100)}
+                    for symbol in rng.sample(universe, holdings)
+                ],
+            }
+            for i in range(users)
+        ])
+
+    return seed
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--mongo-uri", default=None, help="Use a real MongoDB instead of the in-memory stand-in")
+    arg_parser.add_argument("--users", type=int, default=200)
+    arg_parser.add_argument("--holdings", type=int, default=10, help="Positions per seeded user")
+    arg_parser.add_argument("--symbols", type=int, default=500)
+    args = arg_parser.parse_args()
+
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        install_mongo_stand_in()
+
+    import main
+
+    # One INFO line per upstream request would dominate the run
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # Seed inside the server's event loop so a real Motor client binds to it
+    main.app.router.on_startup.insert(0, make_seeder(args.users, args.holdings, args.symbols))
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after `ttl` seconds; tracks hit/miss counters."""
+
+    MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Return the cached value or TTLCache.MISSING."""
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return self.MISSING
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class RefreshingCache:
+    """Async read-through cache with stale-while-revalidate and single-flight loads.
+
+    Entries are fresh for `ttl` seconds. For `stale_ttl` seconds after that they are
+    still served while one background task reloads them. Concurrent misses for the
+    same key share a single load; failed loads are not cached.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0):
+        self.ttl = ttl
+        self._entries = TTLCache(maxsize, ttl + stale_ttl)  # key -> (value, fresh_until)
+        self._inflight = {}  # key -> loading task
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0  # Misses that joined a load already in flight
+        self.refresh_errors = 0
+
+    def _load(self, key, loader) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(key, loader))
+            self._inflight[key] = task
+        return task
+
+    async def _run(self, key, loader):
+        try:
+            value = await loader()
+            self._entries.set(key, (value, time.monotonic() + self.ttl))
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _refresh_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+            logger.warning(f"Background refresh failed: {str(task.exception())}")
+
+    async def get(self, key, loader):
+        """Return the value for `key`, calling the coroutine function `loader` to (re)load it."""
+        entry = self._entries.get(key)
+        if entry is not TTLCache.MISSING:
+            value, fresh_until = entry
+            if fresh_until > time.monotonic():
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._load(key, loader).add_done_callback(self._refresh_done)
+            return value
+
+        self.misses += 1
+        if key in self._inflight:
+            self.coalesced += 1
+        # Shielded so one caller going away does not cancel the load the others are waiting on
+        return await asyncio.shield(self._load(key, loader))
+
+    def invalidate(self, key):
+        self._entries.invalidate(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self._entries.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refresh_errors": self.refresh_errors,
+            "evictions": self._entries.evictions,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,87 @@
+"""Settings read from the environment (and .env), loaded once at import.
+
+Every module takes its settings from here rather than calling load_dotenv() itself,
+so a value in .env applies no matter which module is imported first.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# MongoDB; required, but only checked when the client is created at startup
+MONGO_URI = os.getenv("MONGO_URI")
+
+# Auth
+SECRET_KEY = os.getenv("SECRET_KEY")
+# bcrypt cost factor; existing hashes with a different cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads for bcrypt work (bcrypt releases the GIL, so this bounds CPU used by hashing)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Finnhub
+STOCK_API_KEY = os.getenv("STOCK_API_KEY")
+FINNHUB_BASE_URL = os.getenv("FINNHUB_BASE_URL", "https://finnhub.io/api/v1")
+FINNHUB_WS_URL = os.getenv("FINNHUB_WS_URL", "wss://ws.finnhub.io")
+# Finnhub plan budget: 60 calls/min, with a small burst allowance
+FINNHUB_CALLS_PER_MINUTE = int(os.getenv("FINNHUB_CALLS_PER_MINUTE", "60"))
+FINNHUB_BURST = int(os.getenv("FINNHUB_BURST", "10"))
+# Quotes younger than this are reused instead of going upstream again
+QUOTE_MAX_AGE = float(os.getenv("QUOTE_MAX_AGE", "5"))
+# "poll" fetches REST quotes every tick; "stream" ingests the Finnhub trade feed
+TICK_SOURCE = os.getenv("TICK_SOURCE", "poll")
+
+# Upstream resilience
+# Seconds allowed for each phase of a request (pool wait, read, write; connect gets half), by upstream
+FINNHUB_TIMEOUT = float(os.getenv("FINNHUB_TIMEOUT", "3"))
+YAHOO_TIMEOUT = float(os.getenv("YAHOO_TIMEOUT", "5"))
+NEWSDATA_TIMEOUT = float(os.getenv("NEWSDATA_TIMEOUT", "8"))
+# Consecutive failures that open an upstream's circuit, and seconds it stays open before a trial call
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+# Send a second quote request if the first has not answered within this many seconds; 0 disables
+QUOTE_HEDGE_AFTER = float(os.getenv("QUOTE_HEDGE_AFTER", "0"))
+
+# News
+NEWSDATA_API_KEY = os.getenv("NEWSDATA_API_KEY")
+# Seconds news stays fresh, then how long stale results may be served while they are refetched
+NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", "600"))
+NEWS_STALE_TTL = float(os.getenv("NEWS_STALE_TTL", "3600"))
+
+# Price history
+HISTORY_DIR = os.getenv("HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "history"))
+# Stored daily bars younger than this are served without checking upstream
+HISTORY_REFRESH_SECONDS = int(os.getenv("HISTORY_REFRESH_SECONDS", "3600"))
+# Seconds a failed or empty refresh is remembered before upstream is tried again
+HISTORY_RETRY_SECONDS = float(os.getenv("HISTORY_RETRY_SECONDS", "300"))
+# Symbol/interval pairs whose bars (and refresh outcomes) are kept in memory
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "2000"))
+
+# Symbol sync
+# Rows per bulk_write batch
+SYMBOL_SYNC_CHUNK_SIZE = int(os.getenv("SYMBOL_SYNC_CHUNK_SIZE", "1000"))
+# Concurrent profile2 lookups while enriching logos
+SYMBOL_SYNC_LOGO_CONCURRENCY = int(os.getenv("SYMBOL_SYNC_LOGO_CONCURRENCY", "4"))
+# Logo lookups per run; each one spends Finnhub rate budget
+SYMBOL_SYNC_LOGO_LIMIT = int(os.getenv("SYMBOL_SYNC_LOGO_LIMIT", "500"))
+
+# Caches
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+# Trades
+# Seconds a trade may sit in a user's pending_transactions outbox before the reconciler records it
+TRADE_RECONCILE_SECONDS = float(os.getenv("TRADE_RECONCILE_SECONDS", "60"))
+# Cached quotes younger than this fill trades without a new upstream call
+EXECUTION_PRICE_MAX_AGE = float(os.getenv("EXECUTION_PRICE_MAX_AGE", "30"))
+
+# Upper bound on concurrent upstream quote calls per valuation request
+PORTFOLIO_QUOTE_CONCURRENCY = int(os.getenv("PORTFOLIO_QUOTE_CONCURRENCY", "8"))
+# Seconds between full leaderboard rebuilds from the users collection (heals drift and missed updates)
+LEADERBOARD_REBUILD_SECONDS = int(os.getenv("LEADERBOARD_REBUILD_SECONDS", "3600"))
+
+# WebSockets and pub/sub
+# Seconds a client may keep an unsent backlog before it is disconnected
+WS_MAX_CLIENT_LAG = float(os.getenv("WS_MAX_CLIENT_LAG", "10"))
+# Empty for the in-process backend (single worker); e.g. redis://localhost:6379/0 to fan out across workers
+PUBSUB_URL = os.getenv("PUBSUB_URL", "")
+PUBSUB_PREFIX = os.getenv("PUBSUB_PREFIX", "stock")
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from config import WS_MAX_CLIENT_LAG as MAX_CLIENT_LAG
+
+logger = logging.getLogger(__name__)
+
+# Seconds allowed for the close handshake with a client being dropped
+CLOSE_TIMEOUT = 2.0
+
+# Process-wide outbound counters
+send_stats = {
+    "frames_enqueued": 0,
+    "frames_sent": 0,
+    "frames_dropped": 0,  # Replaced by a newer value before they could be sent
+    "send_errors": 0,
+    "slow_disconnects": 0,
+}
+
+# Placeholder key for the per-symbol price entries merged into one frame at send time
+_PRICES = "stock_updates"
+
+
+class ClientState:
+    """One WebSocket connection: its subscriptions and a latest-value-wins outbound queue.
+
+    Legacy clients send a bare symbol and get a `stock_update` frame for it every tick.
+    Clients using the JSON protocol get one `stock_updates` frame per tick containing
+    only the symbols whose price changed since their last frame.
+
+    Each queue key (frame type, or symbol for price entries) holds at most one pending
+    message, so a client that falls behind gets newer values replacing stale ones
+    instead of a growing backlog. A dedicated writer task drains the queue, so the
+    broadcaster never waits on a slow socket.
+    """
+
+    def __init__(self, websocket, symbol: str = "AAPL", on_close=None):
+        self.websocket = websocket
+        self.symbols = {symbol}
+        self.legacy = True
+        self.last_sent = {}  # symbol -> (price, stale) last queued for this client
+        self.dropped = 0
+        self.backlog_since = None  # monotonic time the queue last went from empty to non-empty
+        self._pending = {}  # key -> serialized frame, in first-enqueued order
+        self._pending_prices = {}  # symbol -> serialized price entry
+        self._wakeup = asyncio.Event()
+        self._on_close = on_close
+        self._writer = None
+        self.closed = False
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending) + len(self._pending_prices)
+
+    def _mark_pending(self, key: str, replaced: bool):
+        send_stats["frames_enqueued"] += 1
+        if replaced:
+            self.dropped += 1
+            send_stats["frames_dropped"] += 1
+        if self.backlog_since is None:
+            self.backlog_since = time.monotonic()
+        self._wakeup.set()
+
+    def enqueue(self, key: str, message: str):
+        """Queue a frame, replacing any unsent frame with the same key."""
+        if self.closed:
+            return
+        replaced = key in self._pending
+        self._pending[key] = message
+        self._mark_pending(key, replaced)
+
+    def enqueue_prices(self, entries: dict):
+        """Queue per-symbol price entries; unsent entries for the same symbol are replaced."""
+        if self.closed or not entries:
+            return
+        for symbol, entry in entries.items():
+            replaced = symbol in self._pending_prices
+            self._pending_prices[symbol] = entry
+            if replaced:
+                self.dropped += 1
+                send_stats["frames_dropped"] += 1
+        self._mark_pending(_PRICES, replaced=False)
+        self._pending.setdefault(_PRICES, None)
+
+    def is_lagging(self, now: float) -> bool:
+        return self.backlog_since is not None and now - self.backlog_since > MAX_CLIENT_LAG
+
+    def _next_frame(self) -> str:
+        key = next(iter(self._pending))
+        message = self._pending.pop(key)
+        if key == _PRICES:
+            data = ", ".join(self._pending_prices.values())
+            self._pending_prices = {}
+            message = f'{{"event": "stock_updates", "data": [{data}]}}'
+        return message
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._pending:
+                    await self.websocket.send_text(self._next_frame())
+                    send_stats["frames_sent"] += 1
+                self.backlog_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            send_stats["send_errors"] += 1
+            logger.info(f"Send to {self.websocket.client} failed: {str(e)}")
+            self._close()
+
+    def _close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._pending.clear()
+        self._pending_prices.clear()
+        if self._on_close:
+            self._on_close(self)
+
+    async def close(self):
+        """Stop the writer and forget queued frames (idempotent)."""
+        self._close()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def disconnect_slow(self):
+        """Drop a client that has stayed behind for too long."""
+        send_stats["slow_disconnects"] += 1
+        logger.info(f"Disconnecting slow client {self.websocket.client} (dropped {self.dropped} frames)")
+        await self.close()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=1013), CLOSE_TIMEOUT)
+        except Exception:
+            pass
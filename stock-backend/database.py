@@ -1,24 +1,122 @@
+import logging
 from motor.motor_asyncio import AsyncIOMotorClient
-import os
-from dotenv import load_dotenv
+from config import MONGO_URI
+from metrics import MongoCommandTimer
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-MONGO_URI = os.getenv("MONGO_URI")
+# Created by connect_mongo() in the app's startup hook, not at import
+client = None
+db = None
 
-if not MONGO_URI:
-    raise ValueError("MONGO_URI not found. Check your .env file.")
 
-try:
-    client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=5000)  # 5s timeout
+class LazyCollection:
+    """Module-level handle to a collection that binds to the client once it is connected.
+
+    Lets modules keep `from database import users_collection` while the Motor client
+    itself is only created inside the running event loop.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collection = None
+
+    def bind(self, database):
+        self._collection = database[self.name]
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            raise RuntimeError(f"MongoDB is not connected; cannot use the {self.name} collection before startup")
+        return getattr(self._collection, attr)
+
+
+users_collection = LazyCollection("users")
+transactions_collection = LazyCollection("transactions")
+stocks_collection = LazyCollection("stocks")
+stock_symbols_collection = LazyCollection("stock_symbols")  # NEW: Collection for stock symbols
+portfolio_snapshots_collection = LazyCollection("portfolio_snapshots")  # Per-user analytics replay state
+
+COLLECTIONS = (
+    users_collection,
+    transactions_collection,
+    stocks_collection,
+    stock_symbols_collection,
+    portfolio_snapshots_collection,
+)
+
+def connect_mongo(mongo_client=None):
+    """Create the Motor client (or adopt `mongo_client`) and bind every collection; no-op if already connected."""
+    global client, db
+    if client is not None:
+        return
+    if mongo_client is None:
+        if not MONGO_URI:
+            raise ValueError("MONGO_URI not found. Check your .env file.")
+        try:
+            mongo_client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=5000, event_listeners=[MongoCommandTimer()])  # 5s timeout
+        except Exception as e:
+            raise RuntimeError(f"Error connecting to MongoDB: {str(e)}")
+    client = mongo_client
     db = client.stock_market
-    users_collection = db["users"]
-    transactions_collection = db["transactions"]
-    stocks_collection = db["stocks"]
-    stock_symbols_collection = db["stock_symbols"]  # NEW: Collection for stock symbols
-except Exception as e:
-    raise RuntimeError(f"Error connecting to MongoDB: {str(e)}")
+    for collection in COLLECTIONS:
+        collection.bind(db)
+
+# Indexes the app's queries rely on, as collection -> [(keys, options)]. Lookups by _id
+# (user profiles and portfolios, analytics snapshots) use the default _id index.
+INDEXES = {
+    "users": [
+        # Register/login look users up by email; unique also stops concurrent duplicate sign-ups
+        ([("email", 1)], {"unique": True}),
+        # The trade reconciler's scan for stranded outbox entries; sparse, so idle users are not indexed
+        ([("pending_transactions.timestamp", 1)], {"sparse": True}),
+    ],
+    "transactions": [
+        # Trade history pages and the analytics replay, newest or oldest first
+        ([("user_id", 1), ("timestamp", -1), ("_id", -1)], {}),
+        # Trade history filtered by symbol
+        ([("user_id", 1), ("symbol", 1), ("timestamp", -1), ("_id", -1)], {}),
+    ],
+    "stock_symbols": [
+        # Symbol listing by exchange and the sync's per-symbol upserts
+        ([("exchange", 1), ("symbol", 1)], {}),
+    ],
+}
+
+def index_name(keys) -> str:
+    """The name MongoDB gives an index created without an explicit one, e.g. "user_id_1_timestamp_-1"."""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+async def create_indexes():
+    """Create every declared index; a failure (e.g. duplicate emails) is logged and the rest still built."""
+    for name, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                await db[name].create_index(keys, **options)
+            except Exception as e:
+                logger.error(f"Could not create index {name}.{index_name(keys)}: {str(e)}")
+
+
+async def check_indexes():
+    """Compare the live indexes with INDEXES and log missing, undeclared and unused ones."""
+    for name, indexes in INDEXES.items():
+        declared = {index_name(keys) for keys, _ in indexes}
+        live = {index["name"] async for index in db[name].list_indexes()}
+        for missing in sorted(declared - live):
+            logger.warning(f"Missing index {name}.{missing}: queries relying on it scan the collection")
+        for extra in sorted(live - declared - {"_id_"}):
+            logger.info(f"Index {name}.{extra} is not declared in database.INDEXES; drop it if nothing else uses it")
+
+        try:
+            stats = await db[name].aggregate([{"$indexStats": {}}]).to_list(None)
+        except Exception as e:
+            logger.info(f"Index usage for {name} unavailable: {str(e)}")
+            continue
+        # Counters are per server and reset when it restarts
+        for stat in stats:
+            if stat["name"] != "_id_" and not stat["accesses"]["ops"]:
+                logger.info(f"Index {name}.{stat['name']} unused since {stat['accesses']['since']}")
 
 async def close_mongo_connection():
     """Gracefully close the MongoDB connection."""
-    client.close()
+    if client is not None:
+        client.close()
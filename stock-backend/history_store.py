@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import re
+import time
+import numpy as np
+from cache import TTLCache
+from config import HISTORY_CACHE_SIZE, HISTORY_DIR, HISTORY_REFRESH_SECONDS as DAILY_REFRESH_SECONDS
+from config import HISTORY_RETRY_SECONDS, YAHOO_TIMEOUT
+from metrics import upstream_request_seconds
+
+logger = logging.getLogger(__name__)
+
+# Stored bars younger than this are served without checking upstream
+HISTORY_REFRESH_SECONDS = {"1d": DAILY_REFRESH_SECONDS, "1h": 300}
+# How much history the first fetch of a symbol pulls in
+HISTORY_BACKFILL = {"1d": "1y", "1h": "1mo"}
+
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),  # Bar open time, epoch seconds UTC
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+
+_SYMBOL_RE = re.compile(r"[A-Z0-9.\-^=]{1,20}")
+
+
+class HistoryStore:
+    """Per-symbol, per-interval OHLCV bars kept as memory-mapped .npy files, refreshed incrementally."""
+
+    def __init__(self, root: str = HISTORY_DIR):
+        self.root = root
+        # (symbol, interval) -> memory-mapped bar array; evicted maps are reopened on demand
+        self._bars = TTLCache(HISTORY_CACHE_SIZE, DAILY_REFRESH_SECONDS)
+        # (symbol, interval) -> exception from the last refresh, or None if it found nothing to store;
+        # while present, upstream is not asked again
+        self._checked = TTLCache(HISTORY_CACHE_SIZE, HISTORY_RETRY_SECONDS)
+        self._refreshing = {}  # (symbol, interval) -> refresh task in flight
+
+    def _path(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, interval, f"{symbol}.npy")
+
+    def _load(self, symbol: str, interval: str):
+        key = (symbol, interval)
+        bars = self._bars.get(key)
+        if bars is TTLCache.MISSING:
+            path = self._path(symbol, interval)
+            if not os.path.exists(path):
+                return np.empty(0, dtype=BAR_DTYPE)
+            bars = np.load(path, mmap_mode="r")
+            self._bars.set(key, bars)
+        return bars
+
+    def _is_fresh(self, symbol: str, interval: str) -> bool:
+        """Whether the stored bars are recent enough, or upstream was tried too recently to ask again."""
+        if self._checked.get((symbol, interval)) is not TTLCache.MISSING:
+            return True
+        try:
+            age = time.time() - os.path.getmtime(self._path(symbol, interval))
+        except OSError:
+            return False
+        return age < HISTORY_REFRESH_SECONDS[interval]
+
+    def _fetch(self, symbol: str, interval: str, start_ts):
+        """Download bars from Yahoo Finance starting at `start_ts` (or the backfill period)."""
+        import yfinance as yf
+
+        ticker = yf.Ticker(symbol)
+        if start_ts is None:
+            hist = ticker.history(period=HISTORY_BACKFILL[interval], interval=interval, timeout=YAHOO_TIMEOUT)
+        else:
+            start = np.datetime64(int(start_ts), "s").astype("datetime64[D]").item()
+            hist = ticker.history(start=start, interval=interval, timeout=YAHOO_TIMEOUT)
+
+        bars = np.empty(len(hist), dtype=BAR_DTYPE)
+        if len(hist):
+            bars["ts"] = hist.index.asi8 // 1_000_000_000
+            bars["open"] = hist["Open"].to_numpy()
+            bars["high"] = hist["High"].to_numpy()
+            bars["low"] = hist["Low"].to_numpy()
+            bars["close"] = hist["Close"].to_numpy()
+            bars["volume"] = hist["Volume"].to_numpy()
+        return bars
+
+    def _refresh(self, symbol: str, interval: str, existing):
+        """Fetch only bars after the last stored one and write the merged array to a temporary file.
+
+        Runs in a worker thread, so it leaves the caches alone; returns (merged bars, temporary
+        path), or None when upstream had nothing new.
+        """
+        last_ts = int(existing["ts"][-1]) if len(existing) else None
+        fetched = self._fetch(symbol, interval, last_ts)
+        if not len(fetched):
+            return None
+
+        # The last stored bar may have been partial (e.g. today's session), so fetched bars replace it
+        # (boolean indexing copies, so nothing below still points into the old map)
+        combined = np.concatenate([existing[existing["ts"] < fetched["ts"][0]], fetched])
+
+        path = self._path(symbol, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, combined)
+        return combined, tmp_path
+
+    async def _update(self, symbol: str, interval: str):
+        key = (symbol, interval)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            existing = self._load(symbol, interval)
+            refreshed = await asyncio.to_thread(self._refresh, symbol, interval, existing)
+            status = "ok"
+        except Exception as e:
+            self._checked.set(key, e)
+            logger.warning(f"History refresh for {symbol} failed: {str(e)}")
+            return
+        finally:
+            # yfinance uses its own session, so it is timed here rather than by the shared client
+            upstream_request_seconds.observe(time.perf_counter() - started, "yahoo", f"history/{interval}", status)
+
+        path = self._path(symbol, interval)
+        if refreshed is None:
+            if len(existing):
+                os.utime(path)  # Nothing new upstream; mark as checked
+            else:
+                self._checked.set(key, None)  # Unknown or delisted symbol: do not ask again right away
+            return
+
+        combined, tmp_path = refreshed
+        # Windows cannot replace a file that is still mapped: drop this store's map first
+        self._bars.invalidate(key)
+        del existing
+        try:
+            os.replace(tmp_path, path)
+        except PermissionError as e:
+            # A request still holds the old map; serve the new bars from memory until the retry window passes
+            os.remove(tmp_path)
+            self._bars.set(key, combined)
+            self._checked.set(key, None)
+            logger.warning(f"Could not replace stored history for {symbol}, keeping it in memory: {str(e)}")
+            return
+        self._bars.set(key, np.load(path, mmap_mode="r"))
+
+    async def get_bars(self, symbol: str, interval: str = "1d"):
+        """Return stored bars, refreshing from upstream only when the stored copy is stale."""
+        symbol = symbol.upper()
+        if not _SYMBOL_RE.fullmatch(symbol):
+            raise ValueError(f"Invalid symbol: {symbol}")
+        if interval not in HISTORY_BACKFILL:
+            raise ValueError(f"Unsupported interval: {interval}")
+
+        key = (symbol, interval)
+        if not self._is_fresh(symbol, interval):
+            # Concurrent requests for the same bars share one refresh
+            task = self._refreshing.get(key)
+            if task is None:
+                task = asyncio.create_task(self._update(symbol, interval))
+                self._refreshing[key] = task
+                task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+            await asyncio.shield(task)
+
+        bars = self._load(symbol, interval)
+        error = self._checked.get(key)
+        # Serve what we have rather than failing the chart; with nothing stored, report the failure
+        if not len(bars) and isinstance(error, Exception):
+            raise RuntimeError(f"Price history for {symbol} unavailable: {str(error)}")
+        return bars
+
+
+def format_dates(ts) -> list:
+    """Vectorized epoch-seconds -> YYYY-MM-DD strings."""
+    return np.datetime_as_string(ts.astype("datetime64[s]"), unit="D").tolist()
+
+
+history_store = HistoryStore()
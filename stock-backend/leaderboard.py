@@ -0,0 +1,282 @@
+import asyncio
+import json
+import logging
+import math
+from bisect import bisect_left, insort
+from bson import ObjectId
+import market_data
+from config import LEADERBOARD_REBUILD_SECONDS
+from database import users_collection
+from pubsub import broker
+
+logger = logging.getLogger(__name__)
+
+# Seconds between applying batched price changes to user valuations
+LEADERBOARD_INTERVAL = 2
+# How old a cached quote may be before the leader re-quotes a held symbol after a rebuild
+LEADERBOARD_PRICE_MAX_AGE = 900
+LEADERBOARD_QUOTE_CONCURRENCY = 4
+# Seconds between the leader sharing its held-symbol prices with the other workers
+LEADERBOARD_SHARE_INTERVAL = 60
+# Moving one entry in the sorted list costs O(n); once a batch changes more than about
+# RESORT_FACTOR * sqrt(n) users, a single re-sort is cheaper (measured at 20k and 200k users)
+RESORT_FACTOR = 10
+
+POSITIONS_CHANNEL = "positions"
+
+
+class Leaderboard:
+    """Users ranked by portfolio value, updated incrementally.
+
+    Keeps each user's holdings, a symbol -> {user: quantity} index of holders, total
+    shares held per symbol, and a list of (-value, user) sorted with bisect. A price
+    change only revalues the holders of that symbol; a trade only revalues its user.
+
+    Only the elected tick producer (`leader`) quotes held symbols upstream, so the rate
+    budget is spent once however many workers run; it shares the prices it holds with
+    the others over POSITIONS_CHANNEL.
+    """
+
+    def __init__(self):
+        self.holdings = {}  # user -> {symbol: quantity}
+        self.holders = {}  # symbol -> {user: quantity}
+        self.total_shares = {}  # symbol -> shares held across all users
+        self.prices = {}  # symbol -> price the current valuations use
+        self.values = {}  # user -> portfolio value
+        self.names = {}  # user -> username
+        self.ready = False
+        self.leader = False  # Set by the tick producer's election
+        self._quoting = None  # Leader's background task quoting held symbols
+        self._ranked = []  # (-value, user), ascending = richest first
+        self._pending_prices = {}  # symbol -> latest observed price, not yet applied
+        self._changed_users = None  # Users whose positions changed while a rebuild was scanning
+
+    def __len__(self):
+        return len(self.values)
+
+    def _set_value(self, user: str, value: float):
+        old = self.values.get(user)
+        if old is not None:
+            del self._ranked[bisect_left(self._ranked, (-old, user))]
+        self.values[user] = value
+        insort(self._ranked, (-value, user))
+
+    def _hold(self, user: str, symbol: str, quantity: int) -> int:
+        """Record a user's absolute quantity of a symbol in the indexes; returns the change in shares."""
+        held = self.holdings.setdefault(user, {})
+        delta = quantity - held.get(symbol, 0)
+        if quantity > 0:
+            held[symbol] = quantity
+            self.holders.setdefault(symbol, {})[user] = quantity
+        else:
+            held.pop(symbol, None)
+            self.holders.get(symbol, {}).pop(user, None)
+            if not self.holders.get(symbol):
+                self.holders.pop(symbol, None)
+        self.total_shares[symbol] = self.total_shares.get(symbol, 0) + delta
+        return delta
+
+    def set_position(self, user: str, symbol: str, quantity: int):
+        """Set a user's absolute quantity of a symbol and revalue that user."""
+        delta = self._hold(user, symbol, quantity)
+        self._set_value(user, self.values.get(user, 0.0) + delta * self.prices.get(symbol, 0.0))
+
+    def apply_trade(self, user: str, symbol: str, delta: int):
+        self.set_position(user, symbol, self.holdings.get(user, {}).get(symbol, 0) + delta)
+
+    def record_quote(self, symbol: str, quote: dict, volume: float = 0):
+        """Quote listener: remember the price; valuations catch up on the next apply_prices()."""
+        price = quote.get("c")
+        if price:
+            self._pending_prices[symbol] = price
+
+    def apply_prices(self) -> int:
+        """Revalue the holders of every symbol whose price moved; returns how many users changed."""
+        pending, self._pending_prices = self._pending_prices, {}
+        changes = {}
+        for symbol, price in pending.items():
+            old = self.prices.get(symbol, 0.0)
+            self.prices[symbol] = price
+            if price != old and symbol in self.holders:
+                changes[symbol] = price - old
+
+        deltas = {}
+        for symbol, change in changes.items():
+            for user, quantity in self.holders[symbol].items():
+                deltas[user] = deltas.get(user, 0.0) + quantity * change
+
+        if len(deltas) > RESORT_FACTOR * math.sqrt(len(self.values)):
+            for user, delta in deltas.items():
+                self.values[user] += delta
+            self._ranked = sorted((-value, user) for user, value in self.values.items())
+        else:
+            for user, delta in deltas.items():
+                self._set_value(user, self.values[user] + delta)
+        return len(deltas)
+
+    def top(self, n: int) -> list:
+        return [
+            {"rank": i + 1, "user_id": user, "username": self.names.get(user), "value": round(-value, 2)}
+            for i, (value, user) in enumerate(self._ranked[:n])
+        ]
+
+    def rank(self, user: str):
+        """(1-based rank, value) of a user, or None if they are not ranked."""
+        value = self.values.get(user)
+        if value is None:
+            return None
+        return bisect_left(self._ranked, (-value, user)) + 1, round(value, 2)
+
+    def _load_user(self, user: dict):
+        """Replace a user's holdings with those of their database document (no revaluation)."""
+        user_id = str(user["_id"])
+        self.names[user_id] = user.get("username")
+        for symbol in list(self.holdings.get(user_id, {})):
+            self._hold(user_id, symbol, 0)
+        self.holdings[user_id] = {}
+        for position in user.get("portfolio") or []:
+            held = self.holdings[user_id].get(position["symbol"], 0)
+            self._hold(user_id, position["symbol"], held + position["quantity"])
+
+    async def rebuild(self):
+        """Reload every user's holdings from the database and swap in the new state.
+
+        Valuations start from the prices already known (previous state, then the quote
+        cache); nothing waits on upstream. The leader then refreshes held symbols in the
+        background, and the new quotes arrive through record_quote().
+
+        Users whose positions change during the scan may already have been read, so they
+        are read again once it finishes; the swap itself does not yield to the feed.
+        """
+        fresh = Leaderboard()
+        self._changed_users = set()
+        try:
+            async for user in users_collection.find({}, {"username": 1, "portfolio": 1}):
+                fresh._load_user(user)
+            while self._changed_users:
+                changed, self._changed_users = self._changed_users, set()
+                query = {"_id": {"$in": [ObjectId(user) for user in changed]}}
+                async for user in users_collection.find(query, {"username": 1, "portfolio": 1}):
+                    fresh._load_user(user)
+        finally:
+            self._changed_users = None
+
+        for symbol in fresh.holders:
+            quote = market_data.peek_quote(symbol) or {}
+            price = quote.get("c") or self.prices.get(symbol)
+            if price:
+                fresh.prices[symbol] = price
+
+        # Value and sort everyone once instead of inserting users one at a time
+        fresh.values = {
+            user: sum(quantity * fresh.prices.get(symbol, 0.0) for symbol, quantity in held.items())
+            for user, held in fresh.holdings.items()
+        }
+        fresh._ranked = sorted((-value, user) for user, value in fresh.values.items())
+
+        # Prices observed while rebuilding are replayed onto the new state
+        fresh._pending_prices.update(self._pending_prices)
+        for name in ("holdings", "holders", "total_shares", "prices", "values", "names", "_ranked", "_pending_prices"):
+            setattr(self, name, getattr(fresh, name))
+        self.ready = True
+        logger.info(f"Leaderboard rebuilt: {len(self.values)} users, {len(self.holders)} held symbols")
+        if self.leader:
+            self.refresh_prices()
+
+    def refresh_prices(self):
+        """Leader only: quote held symbols older than LEADERBOARD_PRICE_MAX_AGE in the background."""
+        if self._quoting is None or self._quoting.done():
+            self._quoting = asyncio.create_task(self._quote_held())
+
+    async def _quote_held(self):
+        # One quote per distinct held symbol, not per holding
+        semaphore = asyncio.Semaphore(LEADERBOARD_QUOTE_CONCURRENCY)
+
+        async def price(symbol):
+            async with semaphore:
+                try:
+                    await market_data.get_quote(symbol, LEADERBOARD_PRICE_MAX_AGE)
+                except Exception as e:
+                    logger.warning(f"Leaderboard could not price {symbol}: {str(e)}")
+
+        await asyncio.gather(*(price(symbol) for symbol in list(self.holders)))
+        await self.share_prices()
+
+    async def share_prices(self):
+        """Leader only: publish the prices of held symbols so followers value holdings without quoting."""
+        self.apply_prices()
+        prices = {symbol: self.prices[symbol] for symbol in self.holders if symbol in self.prices}
+        if prices:
+            await broker.publish(POSITIONS_CHANNEL, json.dumps({"prices": prices}))
+
+    async def _apply_prices_loop(self):
+        elapsed = shared = 0
+        was_leader = False
+        while True:
+            if not self.ready or elapsed >= LEADERBOARD_REBUILD_SECONDS:
+                try:
+                    await self.rebuild()
+                except Exception as e:
+                    logger.error(f"Leaderboard rebuild failed: {str(e)}")
+                elapsed = 0
+            elif self.leader and not was_leader:
+                # Newly elected: price whatever the previous leader left unpriced
+                self.refresh_prices()
+            was_leader = self.leader
+            self.apply_prices()
+            if self.leader and shared >= LEADERBOARD_SHARE_INTERVAL:
+                try:
+                    await self.share_prices()
+                except Exception as e:
+                    logger.error(f"Leaderboard price share failed: {str(e)}")
+                shared = 0
+            await asyncio.sleep(LEADERBOARD_INTERVAL)
+            elapsed += LEADERBOARD_INTERVAL
+            shared += LEADERBOARD_INTERVAL
+
+    async def _follow_positions(self):
+        """Apply position changes published by any worker, and prices shared by the leader."""
+        while True:
+            try:
+                async for message in broker.subscribe(POSITIONS_CHANNEL):
+                    change = json.loads(message)
+                    if "prices" in change:
+                        if not self.leader:
+                            self._pending_prices.update(change["prices"])
+                        continue
+                    if self._changed_users is not None:
+                        # The rebuild in progress re-reads this user before swapping in
+                        self._changed_users.add(change["user"])
+                    if not self.ready:
+                        continue
+                    if "quantity" in change:
+                        self.set_position(change["user"], change["symbol"], change["quantity"])
+                    else:
+                        self.apply_trade(change["user"], change["symbol"], change["delta"])
+            except Exception as e:
+                logger.error(f"Leaderboard position feed error: {str(e)}")
+                await asyncio.sleep(LEADERBOARD_INTERVAL)
+
+    def start(self):
+        asyncio.create_task(self._follow_positions())
+        asyncio.create_task(self._apply_prices_loop())
+
+
+async def publish_trade(user_id, symbol: str, delta: int):
+    """Tell every worker's leaderboard that a user's position changed by `delta` shares."""
+    try:
+        await broker.publish(POSITIONS_CHANNEL, json.dumps({"user": str(user_id), "symbol": symbol, "delta": delta}))
+    except Exception as e:
+        logger.error(f"Failed to publish position change: {str(e)}")
+
+
+async def publish_position(user_id, symbol: str, quantity: int):
+    """Tell every worker's leaderboard that a user's position was set to `quantity` shares."""
+    try:
+        await broker.publish(POSITIONS_CHANNEL, json.dumps({"user": str(user_id), "symbol": symbol, "quantity": quantity}))
+    except Exception as e:
+        logger.error(f"Failed to publish position change: {str(e)}")
+
+
+leaderboard = Leaderboard()
+market_data.quote_listeners.append(leaderboard.record_quote)
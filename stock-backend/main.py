@@ -1,26 +1,39 @@
+import time
+
+# Taken before anything else is imported so the startup report covers the whole import
+IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-import requests
-import os
-from dotenv import load_dotenv
+from fastapi.responses import PlainTextResponse
 import logging
-import random
+import json
 import asyncio
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
 from routes import users, stocks, portfolio, trading
+import market_data
+from search_index import follow_symbol_changes, load_search_index, symbol_index
+from user_cache import follow_invalidations, user_cache
+from config import TICK_SOURCE
+from tick_stream import trade_stream
+from market_movers import market_movers
+from leaderboard import leaderboard
+from connections import ClientState, send_stats
+from pubsub import LEADER_TTL, TICKS_CHANNEL, WORKER_ID, broker
+import metrics
+from responses import FastJSONResponse
+from database import check_indexes, close_mongo_connection, connect_mongo, create_indexes
 
-# Load environment variables
-load_dotenv()
-
-# Initialize FastAPI app
-app = FastAPI()
+# Initialize FastAPI app; responses are rendered with orjson unless a route says otherwise
+app = FastAPI(default_response_class=FastJSONResponse)
 
 origins = [
     "http://localhost:3000",  # Local development
     "https://stock-project-mu.vercel.app",  # Production frontend
 ]
 
+app.add_middleware(metrics.MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,  # Allow these origins
@@ -29,129 +42,346 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-# Stock API configuration
-STOCK_API_KEY = os.getenv("STOCK_API_KEY")
-BASE_URL = "https://finnhub.io/api/v1/quote"
 # Include routers
 app.include_router(users.router, prefix="/users")
 app.include_router(stocks.router, prefix="/stocks")
 app.include_router(portfolio.router, prefix="/portfolio")
 app.include_router(trading.router, prefix="/trading")
-# Initialize thread executor for blocking I/O operations
-executor = ThreadPoolExecutor()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Symbols accepted before the symbol universe has been loaded
+DEFAULT_SYMBOLS = {"AAPL", "GOOGL", "MSFT", "AMZN", "TSLA", "NVDA", "META"}
+# Upper bound on symbols a single connection may watch
+MAX_SUBSCRIPTIONS = 50
+# In stream mode, how old a REST quote may be for symbols that have not traded yet
+STREAM_QUOTE_MAX_AGE = 30
+# Seconds between price ticks
+TICK_INTERVAL = 2
+
 # Store connected WebSockets
 connected_clients = {}
+# Whether this worker currently holds the tick-producer role
+is_leader = False
 
-def fetch_stock_price(symbol: str):
-    """Fetch real-time stock price from Finnhub API (synchronous request)."""
-    url = f"{BASE_URL}?symbol={symbol}&token={STOCK_API_KEY}"
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("c")  # Current stock price
-        logger.warning(f"Failed to fetch stock price: {response.status_code}")
-        return None
-    except Exception as e:
-        logger.error(f"Error fetching stock price: {str(e)}")
+def is_known_symbol(symbol: str) -> bool:
+    """Check a symbol against the universe loaded from stock_symbols_collection."""
+    if len(symbol_index):
+        return symbol in symbol_index
+    return symbol in DEFAULT_SYMBOLS
+
+async def fetch_symbol_price(symbol: str, max_age: float = 0):
+    """Fetch a symbol's price as (price, age), falling back to the last known good price.
+
+    `age` is None for a fresh price and the seconds since it was fetched for a stale one;
+    returns None if the symbol has never been priced.
+    """
+    result = await market_data.get_quote(symbol, max_age, stale_ok=True)
+    price = result.quote.get("c") if result.quote else None  # Current stock price
+    if not price:
         return None
+    return round(price, 2), (round(result.age, 1) if result.age > max_age else None)
+
+def forget_client(client: ClientState):
+    connected_clients.pop(client.websocket, None)
+
+async def fetch_tick_prices(symbols: list):
+    """Latest prices for this tick, from the trade stream when it is up, else by polling.
+
+    Returns ({symbol: price}, {symbol: age}) where the second dict holds the symbols whose
+    upstream fetch failed and that carry their last known good price instead. Symbols
+    never priced are left out.
+    """
+    prices, max_age = {}, 0
+    if TICK_SOURCE == "stream":
+        await trade_stream.set_symbols(symbols)
+        if trade_stream.connected:
+            streamed = {symbol: trade_stream.latest(symbol) for symbol in symbols}
+            prices = {symbol: round(price, 2) for symbol, price in streamed.items() if price is not None}
+            # Symbols with no trade yet (e.g. outside market hours) use a recent REST quote
+            symbols = [symbol for symbol, price in streamed.items() if price is None]
+            max_age = STREAM_QUOTE_MAX_AGE
+
+    stale = {}
+    polled = await asyncio.gather(*(fetch_symbol_price(symbol, max_age) for symbol in symbols))
+    for symbol, result in zip(symbols, polled):
+        if result is None:
+            continue
+        prices[symbol], age = result
+        if age is not None:
+            stale[symbol] = age
+    return prices, stale
+
+async def keep_leadership():
+    """Renew the producer lock while a tick is being fetched; returns if the lock is lost.
+
+    A tick can outlast LEADER_TTL when it polls many symbols, and letting the lock lapse
+    would hand the role to another worker mid-tick.
+    """
+    while True:
+        await asyncio.sleep(LEADER_TTL / 3)
+        try:
+            if not await broker.acquire_leadership(WORKER_ID):
+                logger.warning(f"{WORKER_ID} lost the tick producer lock during a tick")
+                return
+        except Exception as e:
+            logger.error(f"Tick producer lock renewal failed: {str(e)}")
+
+def local_symbols() -> set:
+    """Symbols watched by this worker's own sockets."""
+    return set().union(*(client.symbols for client in connected_clients.values()))
+
+async def tick_producer():
+    """Advertise this worker's symbols; if elected, fetch prices for every worker's symbols and publish one tick."""
+    global is_leader
+    logger.info(f"Starting tick producer as {WORKER_ID}")
 
-def generate_market_movers():
-    """Generate market movers with realistic price fluctuations."""
-    symbols = [
-        {"symbol": "AAPL", "name": "Apple Inc."},
-        {"symbol": "GOOGL", "name": "Alphabet Inc."},
-        {"symbol": "MSFT", "name": "Microsoft Corporation"},
-        {"symbol": "AMZN", "name": "Amazon.com Inc."},
-        {"symbol": "TSLA", "name": "Tesla Inc."},
-        {"symbol": "NVDA", "name": "NVIDIA Corporation"},
-        {"symbol": "META", "name": "Meta Platforms Inc."},
-        {"symbol": "PYPL", "name": "PayPal Holdings Inc."},
-    ]
-
-    movers = []
-    for stock in symbols:
-        base_price = 100 + random.random() * 500
-        fluctuation = random.uniform(-3.5, 3.5)
-        price = round(base_price + fluctuation, 2)
-        change = round(fluctuation / base_price * 100, 2)
-
-        movers.append({
-            "symbol": stock["symbol"],
-            "name": stock["name"],
-            "price": price,
-            "change": change,
-            "isUp": change >= 0
-        })
-
-    return sorted(movers, key=lambda x: abs(x["change"]), reverse=True)[:5]
-
-async def stock_data_emitter():
-    """Send updates for each client's selected stock"""
-    logger.info("Starting stock data emitter")
-    
     while True:
-        if connected_clients:
-            try:
-                # Process each client's selected symbol
-                for websocket, symbol in list(connected_clients.items()):
-                    loop = asyncio.get_event_loop()
-                    price = await loop.run_in_executor(executor, fetch_stock_price, symbol)
-                    
-                    if price is None:
-                        price = 150 + random.random() * 10
-                    
-                    update_data = {
-                        "symbol": symbol,
-                        "price": round(price, 2),
-                        "time": datetime.now().isoformat()
-                    }
+        try:
+            await broker.set_interest(WORKER_ID, local_symbols())
+            leader = await broker.acquire_leadership(WORKER_ID)
+            if leader != is_leader:
+                is_leader = leaderboard.leader = leader
+                logger.info(f"{WORKER_ID} {'is now' if leader else 'is no longer'} the tick producer")
+                # Only the producer holds an upstream trade-feed connection
+                if TICK_SOURCE == "stream":
+                    if leader:
+                        trade_stream.start()
+                    else:
+                        await trade_stream.stop()
 
+            if is_leader:
+                started = time.perf_counter()
+                symbols = sorted(await broker.get_interest())
+                metrics.emitter_tick_symbols.set(len(symbols))
+                if symbols:
+                    renewer = asyncio.create_task(keep_leadership())
                     try:
-                        await websocket.send_json({
-                            "event": "stock_update",
-                            "data": update_data
-                        })
-                    except:
-                        del connected_clients[websocket]
-
-                # Send market movers to everyone
-                movers = generate_market_movers()
-                for websocket in connected_clients:
-                    await websocket.send_json({"event": "market_movers", "data": movers})
-
-            except Exception as e:
-                logger.error(f"Emitter error: {str(e)}")
-        
-        await asyncio.sleep(2)
+                        prices, stale = await fetch_tick_prices(symbols)
+                    finally:
+                        renewer.cancel()
+                    # The renewer only finishes by itself when another worker took the role mid-tick
+                    if not renewer.done():
+                        tick = {
+                            "source": WORKER_ID,
+                            "time": datetime.now().isoformat(),
+                            "prices": prices,
+                            # Symbols whose upstream fetch failed: last known good price, with its age in seconds
+                            "stale": stale,
+                            # Computed once per tick from tracked quotes; every worker sends the same lists
+                            "summary": market_movers.compute(),
+                        }
+                        await broker.publish(TICKS_CHANNEL, json.dumps(tick))
+                        metrics.emitter_tick_seconds.observe(time.perf_counter() - started)
+                elif TICK_SOURCE == "stream":
+                    # Nobody is watching: release the upstream subscriptions
+                    await trade_stream.set_symbols(())
+        except Exception as e:
+            logger.error(f"Tick producer error: {str(e)}")
+
+        await asyncio.sleep(TICK_INTERVAL)
+
+def deliver_tick(tick: dict):
+    """Send each local client the prices of its subscribed symbols from a published tick."""
+    prices = tick["prices"]
+    stale = tick.get("stale", {})
+    if tick["source"] != WORKER_ID:
+        # Keep this worker's quote cache and movers warm with the producer's fresh prices
+        for symbol, price in prices.items():
+            if symbol not in stale:
+                market_data.record_price(symbol, price)
+
+    metrics.ws_clients.set(len(connected_clients))
+    if not connected_clients:
+        return
+
+    # Serialize each symbol's entry once, then assemble per-client frames from the pieces
+    fragments = {
+        symbol: json.dumps({"symbol": symbol, "price": price, "time": tick["time"]})
+        for symbol, price in prices.items()
+    }
+    for symbol, age in stale.items():
+        fragments[symbol] = json.dumps({"symbol": symbol, "price": prices[symbol], "time": tick["time"], "stale": True, "age": age})
+    # A price turning stale (or fresh again) is news even when the number is unchanged
+    sent_values = {symbol: (price, symbol in stale) for symbol, price in prices.items()}
+
+    # Only enqueue here; each client's writer task does the sending, so a slow
+    # socket cannot hold up the tick for everyone else
+    for client in list(connected_clients.values()):
+        if client.legacy:
+            (symbol,) = client.symbols
+            if symbol in fragments:
+                client.enqueue("stock_update", f'{{"event": "stock_update", "data": {fragments[symbol]}}}')
+            continue
+
+        # Symbols subscribed after the producer read the interest sets arrive next tick
+        changed = {
+            symbol: fragments[symbol] for symbol in client.symbols
+            if symbol in fragments and client.last_sent.get(symbol) != sent_values[symbol]
+        }
+        for symbol in changed:
+            client.last_sent[symbol] = sent_values[symbol]
+        client.enqueue_prices(changed)
+
+    summary = tick["summary"]
+    movers = json.dumps({"event": "market_movers", "data": summary["movers"]})
+    movers_summary = json.dumps({"event": "market_summary", "data": summary})
+    for client in list(connected_clients.values()):
+        client.enqueue("market_movers", movers)
+        client.enqueue("market_summary", movers_summary)
+
+    # Drop clients that have stayed behind for too long
+    now = time.monotonic()
+    depths = []
+    for client in list(connected_clients.values()):
+        depths.append(client.queue_depth)
+        if client.is_lagging(now):
+            asyncio.create_task(client.disconnect_slow())
+    metrics.ws_queue_depth.set(max(depths, default=0), "max")
+    metrics.ws_queue_depth.set(sum(depths), "total")
+
+async def tick_fanout():
+    """Deliver every tick published by the elected producer to this worker's sockets."""
+    while True:
+        try:
+            async for message in broker.subscribe(TICKS_CHANNEL):
+                try:
+                    deliver_tick(json.loads(message))
+                except Exception as e:
+                    logger.error(f"Tick delivery error: {str(e)}")
+        except Exception as e:
+            logger.error(f"Tick subscription error: {str(e)}")
+            await asyncio.sleep(TICK_INTERVAL)
+
+def handle_client_message(client: ClientState, message: str) -> dict:
+    """Apply a subscribe/unsubscribe request (or a legacy bare symbol) and build the acknowledgement."""
+    try:
+        request = json.loads(message)
+    except ValueError:
+        request = None
+
+    if not isinstance(request, dict):
+        # Legacy protocol: a bare symbol replaces the single watched symbol
+        symbol = message.strip().upper()
+        if client.legacy and is_known_symbol(symbol):
+            client.symbols = {symbol}
+        return None
+
+    action = request.get("action")
+    requested = request.get("symbols") or []
+    if action not in ("subscribe", "unsubscribe") or not isinstance(requested, list):
+        return {"event": "error", "detail": "Expected {\"action\": \"subscribe\"|\"unsubscribe\", \"symbols\": [...]}"}
+
+    requested = [str(symbol).strip().upper() for symbol in requested]
+    if client.legacy:
+        # Switching to the JSON protocol starts from an empty watchlist
+        client.legacy = False
+        client.symbols = set()
+
+    rejected = []
+    if action == "subscribe":
+        for symbol in requested:
+            if not is_known_symbol(symbol) or (symbol not in client.symbols and len(client.symbols) >= MAX_SUBSCRIPTIONS):
+                rejected.append(symbol)
+                continue
+            client.symbols.add(symbol)
+    else:
+        for symbol in requested:
+            client.symbols.discard(symbol)
+            client.last_sent.pop(symbol, None)
+
+    return {"event": "subscriptions", "symbols": sorted(client.symbols), "rejected": rejected}
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     # Initialize with default symbol
-    connected_clients[websocket] = "AAPL"
+    client = ClientState(websocket, "AAPL", on_close=forget_client)
+    connected_clients[websocket] = client
+    client.start()
     logger.info(f"New connection: {websocket.client} watching AAPL")
 
     try:
         while True:
-            symbol = await websocket.receive_text()
-            if symbol in ["AAPL", "GOOGL", "MSFT", "AMZN", "TSLA", "NVDA", "META"]:
-                connected_clients[websocket] = symbol
-                logger.info(f"{websocket.client} switched to {symbol}")
+            reply = handle_client_message(client, await websocket.receive_text())
+            if reply:
+                client.enqueue(reply["event"], json.dumps(reply))
     except WebSocketDisconnect:
         logger.info(f"Disconnected: {websocket.client}")
-        del connected_clients[websocket]
+    finally:
+        await client.close()
+
+async def report_indexes():
+    """Log declared indexes that are missing and live ones that are undeclared or unused."""
+    try:
+        await check_indexes()
+    except Exception as e:
+        logger.error(f"Index check failed: {str(e)}")
 
 @app.on_event("startup")
 async def startup_event():
-    """Start background tasks on app startup."""
-    asyncio.create_task(stock_data_emitter())
+    """Connect to MongoDB and start background tasks on app startup."""
+    started = time.perf_counter()
+    connect_mongo()
+    try:
+        await create_indexes()
+    except Exception as e:
+        logger.error(f"Index creation failed: {str(e)}")
+    asyncio.create_task(report_indexes())
+    asyncio.create_task(tick_fanout())
+    asyncio.create_task(follow_invalidations())
+    leaderboard.start()
+    asyncio.create_task(tick_producer())
+    asyncio.create_task(load_search_index())
+    asyncio.create_task(follow_symbol_changes())
+    asyncio.create_task(trading.reconcile_loop())
+
+    startup_seconds = time.perf_counter() - started
+    metrics.startup_seconds.set(IMPORT_SECONDS, "import")
+    metrics.startup_seconds.set(startup_seconds, "startup")
+    logger.info(f"Startup report: imports {IMPORT_SECONDS * 1000:.0f} ms, startup hook {startup_seconds * 1000:.0f} ms")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled upstream and database connections."""
+    await trade_stream.stop()
+    try:
+        # Let another worker take over producing ticks without waiting for the lock to expire
+        await broker.release_leadership(WORKER_ID)
+        await broker.close()
+    except Exception as e:
+        logger.error(f"Pub/sub shutdown failed: {str(e)}")
+    await market_data.close_client()
+    await close_mongo_connection()
+
+@app.get("/ws/stats")
+def get_ws_stats():
+    """Outbound WebSocket counters and current send-queue depths."""
+    depths = [client.queue_depth for client in connected_clients.values()]
+    return {
+        "worker": WORKER_ID,
+        "tick_producer": is_leader,
+        "clients": len(depths),
+        "max_queue_depth": max(depths, default=0),
+        "lagging_clients": sum(1 for client in connected_clients.values() if client.backlog_since is not None),
+        **send_stats,
+    }
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Hit/miss counters for the in-process caches."""
+    return {"users": user_cache.stats(), "news": trading.news_cache.stats(), "quotes": market_data.quote_stats}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Request, upstream, MongoDB and emitter metrics in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def read_root():
     return {"message": "Stock Trading Platform API", "status": "running"}
+
+# Everything above runs on `import main`; startup_event() reports it
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import time
+from typing import NamedTuple, Optional
+import httpx
+from config import (
+    CIRCUIT_COOLDOWN, CIRCUIT_FAILURE_THRESHOLD, FINNHUB_BASE_URL, FINNHUB_BURST, FINNHUB_CALLS_PER_MINUTE,
+    FINNHUB_TIMEOUT, NEWSDATA_TIMEOUT, QUOTE_HEDGE_AFTER, QUOTE_MAX_AGE, STOCK_API_KEY, YAHOO_TIMEOUT,
+)
+from metrics import TimedTransport, upstream_circuit_open, upstream_hedges
+
+logger = logging.getLogger(__name__)
+
+# Explicit timeouts and keep-alive pool shared by every upstream call
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+
+# Per-upstream timeouts; a hung upstream fails within these instead of HTTP_TIMEOUT
+UPSTREAM_TIMEOUTS = {
+    name: httpx.Timeout(seconds, connect=seconds / 2)
+    for name, seconds in (("finnhub", FINNHUB_TIMEOUT), ("yahoo", YAHOO_TIMEOUT), ("newsdata", NEWSDATA_TIMEOUT))
+}
+
+
+class TokenBucket:
+    """Async token-bucket limiter; callers over budget wait in line instead of failing."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # Holding the lock while sleeping keeps waiters in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fails calls fast for `cooldown` seconds once an upstream has failed `threshold` times in a row.
+
+    After the cooldown one trial call is let through (half-open): success closes the
+    circuit, failure opens it for another cooldown.
+    """
+
+    def __init__(self, name: str, threshold: int, cooldown: float):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0  # Consecutive
+        self.opened_at = None
+        self._trial = False
+        self.stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may go upstream."""
+        if self.opened_at is None:
+            return
+        if self._trial or time.monotonic() - self.opened_at < self.cooldown:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        self._trial = True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"{self.name} circuit closed")
+            upstream_circuit_open.set(0, self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or (self.opened_at is None and self.failures >= self.threshold):
+            if not self._trial:
+                logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+            self._trial = False
+            self.stats["opened"] += 1
+            upstream_circuit_open.set(1, self.name)
+
+    def abandon(self):
+        """A call was cancelled before it had an outcome; let another trial through."""
+        self._trial = False
+
+
+class CachedQuote(NamedTuple):
+    quote: Optional[dict]
+    cached: bool  # True when served from the process-wide quote cache
+    age: float  # Seconds since the quote was fetched upstream
+
+
+finnhub_limiter = TokenBucket(FINNHUB_CALLS_PER_MINUTE / 60.0, FINNHUB_BURST)
+
+breakers = {name: CircuitBreaker(name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN) for name in UPSTREAM_TIMEOUTS}
+
+_client = None
+
+# symbol -> (quote, monotonic fetch time), shared by the emitter and every route
+_quote_cache = {}
+
+# symbol -> task fetching it upstream, so concurrent misses share one call
+_inflight_quotes = {}
+
+quote_stats = {"hits": 0, "misses": 0, "coalesced": 0, "stale": 0}
+
+# Callables invoked as listener(symbol, quote, volume) whenever a price is observed
+quote_listeners = []
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the app-lifetime pooled HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        # The pool limits live on the transport, which is wrapped to time every upstream call
+        _client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, transport=TimedTransport(httpx.AsyncHTTPTransport(limits=HTTP_LIMITS)))
+    return _client
+
+
+async def close_client():
+    """Close the pooled HTTP client on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _record_status(breaker: CircuitBreaker, status_code: int):
+    # Server errors and throttling count against the upstream; other client errors are ours
+    if status_code >= 500 or status_code == 429:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+async def _hedged(send, hedge_after: float, upstream: str) -> httpx.Response:
+    """Await send(); if it is still pending after `hedge_after` seconds, race a second send()."""
+    first = asyncio.create_task(send())
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    upstream_hedges.inc(upstream)
+    pending = {first, asyncio.create_task(send())}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def upstream_get(upstream: str, url: str, before_send=None, hedge_after: float = 0, **kwargs) -> httpx.Response:
+    """GET from a named upstream with its timeout, behind its circuit breaker.
+
+    `before_send` is awaited before every request actually sent (e.g. a rate limiter).
+    With `hedge_after` > 0 a slow request is raced by a second one; only use it for
+    idempotent reads.
+    """
+    breaker = breakers[upstream]
+    breaker.before_call()
+
+    async def send():
+        if before_send is not None:
+            await before_send()
+        return await get_client().get(url, timeout=UPSTREAM_TIMEOUTS[upstream], **kwargs)
+
+    try:
+        response = await (_hedged(send, hedge_after, upstream) if hedge_after > 0 else send())
+    except httpx.PoolTimeout:
+        breaker.abandon()  # Our own pool was saturated; says nothing about the upstream
+        raise
+    except httpx.HTTPError:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.abandon()
+        raise
+    _record_status(breaker, response.status_code)
+    return response
+
+
+async def finnhub_get(path: str, hedge_after: float = 0, **params) -> httpx.Response:
+    """GET a Finnhub endpoint through the shared client, the rate-limit budget and the circuit breaker."""
+    params["token"] = STOCK_API_KEY
+    return await upstream_get(
+        "finnhub", f"{FINNHUB_BASE_URL}{path}", before_send=finnhub_limiter.acquire, hedge_after=hedge_after, params=params,
+    )
+
+
+async def iter_json_array(chunks):
+    """Incrementally decode a top-level JSON array of objects from an async text stream."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+
+    async for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # Item is split across chunks, wait for more data
+            yield item
+        buffer = buffer[pos:]
+
+    if not started:
+        # An empty body is not an empty list; callers must not act on it as one
+        raise ValueError("Expected a JSON array, got an empty response")
+    raise ValueError("Truncated JSON array")
+
+
+async def stream_finnhub_array(path: str, **params):
+    """Stream a Finnhub endpoint that returns a JSON array, yielding items as they arrive."""
+    breaker = breakers["finnhub"]
+    breaker.before_call()
+    params["token"] = STOCK_API_KEY
+    try:
+        await finnhub_limiter.acquire()
+        async with get_client().stream(
+            "GET", f"{FINNHUB_BASE_URL}{path}", params=params, timeout=UPSTREAM_TIMEOUTS["finnhub"],
+        ) as response:
+            _record_status(breaker, response.status_code)
+            response.raise_for_status()
+            async for item in iter_json_array(response.aiter_text()):
+                yield item
+    except httpx.PoolTimeout:
+        breaker.abandon()  # Our own pool was saturated; says nothing about the upstream
+        raise
+    except httpx.TransportError:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelled, closed early or failed after the status was recorded: never leave a trial hanging
+        breaker.abandon()
+        raise
+
+
+async def fetch_quote(symbol: str):
+    """Fetch a Finnhub quote (c, d, dp, h, l, o, pc, t) or None on failure."""
+    try:
+        response = await finnhub_get("/quote", hedge_after=QUOTE_HEDGE_AFTER, symbol=symbol)
+        if response.status_code == 200:
+            quote = response.json()
+            _store_quote(symbol, quote)
+            return quote
+        logger.warning(f"Failed to fetch quote for {symbol}: {response.status_code}")
+    except CircuitOpenError:
+        pass  # Logged once when the circuit opened
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching quote for {symbol}: {str(e) or type(e).__name__}")
+    return None
+
+
+def _store_quote(symbol: str, quote: dict, volume: float = 0):
+    _quote_cache[symbol] = (quote, time.monotonic())
+    for listener in quote_listeners:
+        listener(symbol, quote, volume)
+
+
+def record_price(symbol: str, price: float, volume: float = 0):
+    """Fold a pushed trade price into the quote cache so routes see it as a fresh quote."""
+    entry = _quote_cache.get(symbol)
+    quote = dict(entry[0]) if entry else {}
+    quote["c"] = price
+    _store_quote(symbol, quote, volume)
+
+
+def peek_quote(symbol: str) -> Optional[dict]:
+    """The cached quote for a symbol whatever its age, without going upstream; None if never quoted."""
+    entry = _quote_cache.get(symbol)
+    return entry[0] if entry else None
+
+
+async def get_quote(symbol: str, max_age: float = QUOTE_MAX_AGE, stale_ok: bool = False) -> CachedQuote:
+    """Return a quote no older than `max_age` seconds, fetching upstream only on a miss.
+
+    Concurrent misses for the same symbol wait on a single upstream request. If that
+    fails and `stale_ok` is set, the last known good quote is returned with its real age.
+    """
+    entry = _quote_cache.get(symbol)
+    if entry is not None:
+        quote, fetched_at = entry
+        age = time.monotonic() - fetched_at
+        if age <= max_age:
+            quote_stats["hits"] += 1
+            return CachedQuote(quote, True, age)
+
+    quote_stats["misses"] += 1
+    task = _inflight_quotes.get(symbol)
+    if task is None:
+        task = asyncio.create_task(fetch_quote(symbol))
+        _inflight_quotes[symbol] = task
+        task.add_done_callback(lambda _: _inflight_quotes.pop(symbol, None))
+    else:
+        quote_stats["coalesced"] += 1
+    # Shielded so a caller going away does not cancel the fetch others are waiting on
+    quote = await asyncio.shield(task)
+    if quote is None and stale_ok and entry is not None:
+        quote_stats["stale"] += 1
+        return CachedQuote(entry[0], True, time.monotonic() - entry[1])
+    return CachedQuote(quote, False, 0.0)
+
+
+async def fetch_stock_logo(symbol: str):
+    """Fetch a company's logo URL from its Finnhub profile."""
+    try:
+        response = await finnhub_get("/stock/profile2", symbol=symbol)
+        if response.status_code == 200:
+            return response.json().get("logo", None)
+    except CircuitOpenError:
+        pass
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching logo for {symbol}: {str(e) or type(e).__name__}")
+    return None
@@ -0,0 +1,110 @@
+from datetime import date
+import market_data
+from search_index import symbol_index
+
+# Entries per movers list
+MOVERS_TOP_K = 5
+
+
+class MarketMovers:
+    """Last price, previous close and traded volume for every tracked symbol, in arrays indexed by symbol id.
+
+    Quotes are recorded as they are observed anywhere in the app (emitter polls, route
+    lookups, the trade stream); top-k lists are computed with argpartition. The arrays
+    (and NumPy) are only allocated once the first quote arrives, keeping import cheap.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.ids = {}  # symbol -> row
+        self.symbols = []  # row -> symbol
+        self.last = self.prev_close = self.volume = ()
+        self._volume_day = date.today()
+
+    def _grow(self, extra: int):
+        import numpy as np
+
+        self.last = np.concatenate([self.last, np.full(extra, np.nan)])
+        self.prev_close = np.concatenate([self.prev_close, np.full(extra, np.nan)])
+        self.volume = np.concatenate([self.volume, np.zeros(extra)])
+
+    def _row(self, symbol: str) -> int:
+        row = self.ids.get(symbol)
+        if row is None:
+            row = len(self.symbols)
+            if row == len(self.last):
+                # Grow geometrically so appends stay amortized O(1)
+                self._grow(row or self.capacity)
+            self.ids[symbol] = row
+            self.symbols.append(symbol)
+        return row
+
+    def record_quote(self, symbol: str, quote: dict, volume: float = 0):
+        price = quote.get("c")
+        if not price:
+            return
+        row = self._row(symbol)
+        self.last[row] = price
+        if quote.get("pc"):
+            self.prev_close[row] = quote["pc"]
+        if volume:
+            self.volume[row] += volume
+
+    def _entries(self, rows, change) -> list:
+        return [
+            {
+                "symbol": self.symbols[row],
+                "name": symbol_index.name(self.symbols[row]),
+                "price": round(float(self.last[row]), 2),
+                "change": round(float(change[row]), 2),
+                "isUp": bool(change[row] >= 0),
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def _top(values, rows, k: int):
+        """Rows of the k largest `values`, largest first."""
+        import numpy as np
+
+        if len(rows) > k:
+            keep = np.argpartition(-values, k - 1)[:k]
+            rows, values = rows[keep], values[keep]
+        return rows[np.argsort(-values, kind="stable")]
+
+    def compute(self, k: int = MOVERS_TOP_K) -> dict:
+        """Top-k gainers, losers, biggest absolute movers and most active symbols."""
+        if not self.symbols:
+            return {"gainers": [], "losers": [], "movers": [], "most_active": []}
+        import numpy as np
+
+        if date.today() != self._volume_day:
+            self.volume[:] = 0
+            self._volume_day = date.today()
+
+        n = len(self.symbols)
+        last, prev_close, volume = self.last[:n], self.prev_close[:n], self.volume[:n]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (last - prev_close) / prev_close * 100
+        priced = np.flatnonzero(np.isfinite(change))
+        moves = change[priced]
+
+        gainers = self._top(moves, priced, k)
+        gainers = gainers[change[gainers] > 0]
+        losers = self._top(-moves, priced, k)
+        losers = losers[change[losers] < 0]
+        movers = self._top(np.abs(moves), priced, k)
+        # Volume only comes from the trade stream; without it, fall back to the biggest movers
+        traded = priced[volume[priced] > 0]
+        active = self._top(volume[traded], traded, k) if len(traded) else movers
+
+        return {
+            "gainers": self._entries(gainers, change),
+            "losers": self._entries(losers, change),
+            "movers": self._entries(movers, change),
+            "most_active": self._entries(active, change),
+        }
+
+
+market_movers = MarketMovers()
+market_data.quote_listeners.append(market_movers.record_quote)
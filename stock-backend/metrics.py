@@ -0,0 +1,202 @@
+import threading
+import time
+from bisect import bisect_left
+import httpx
+from pymongo import monitoring
+
+# Latency buckets in seconds, shared by every histogram
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upstream hosts reported under a short name
+UPSTREAM_NAMES = {
+    "finnhub.io": "finnhub",
+    "query2.finance.yahoo.com": "yahoo",
+    "newsdata.io": "newsdata",
+}
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # label values -> state
+        self._lock = threading.Lock()  # Mongo events arrive on driver threads
+        _registry.append(self)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = self._header()
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self._series[labels] = value
+
+    def render(self) -> list:
+        lines = self._header()
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observing costs one bisect and two additions."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf) and the running sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = self._header()
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests", ("method", "route", "status"))
+upstream_request_seconds = Histogram(
+    "upstream_request_duration_seconds", "Time spent on upstream API calls", ("upstream", "endpoint", "status"))
+mongo_command_seconds = Histogram(
+    "mongo_command_duration_seconds", "Time spent on MongoDB commands", ("collection", "command", "status"))
+emitter_tick_seconds = Histogram(
+    "emitter_tick_duration_seconds", "Time to fetch prices and publish one tick")
+emitter_tick_symbols = Gauge("emitter_tick_symbols", "Symbols priced in the last published tick")
+ws_clients = Gauge("ws_clients", "WebSocket clients connected to this worker")
+ws_queue_depth = Gauge("ws_send_queue_depth", "Frames waiting in WebSocket send queues", ("stat",))
+upstream_circuit_open = Gauge("upstream_circuit_open", "1 while an upstream's circuit breaker is open", ("upstream",))
+upstream_hedges = Counter("upstream_hedged_requests_total", "Second requests sent because the first was slow", ("upstream",))
+startup_seconds = Gauge("startup_duration_seconds", "Time spent importing the app and in its startup hook", ("phase",))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency of every HTTP request by route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the scope; label by its template, not the raw path
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                scope["method"], route.path if route is not None else "unmatched", str(status))
+
+
+class TimedTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport to time each upstream call by host, path and status."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        status = "error"
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            upstream_request_seconds.observe(
+                time.perf_counter() - started,
+                UPSTREAM_NAMES.get(request.url.host, request.url.host), request.url.path, status)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo listener timing each command by collection and command name."""
+
+    def __init__(self):
+        self._collections = {}  # (connection, request id) -> collection
+
+    def started(self, event):
+        command = event.command
+        target = command.get(event.command_name)
+        # getMore names the cursor id; the collection is in its own field
+        collection = command.get("collection") if event.command_name == "getMore" else target
+        self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event, status: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_seconds.observe(event.duration_micros / 1e6, collection, event.command_name, status)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
@@ -0,0 +1,85 @@
+"""One-off migration: move embedded users.trade_history arrays into the transactions collection.
+
+Run from stock-backend/:
+
+    python -m migrations.migrate_trade_history [--dry-run]
+
+Safe to re-run: each embedded entry is upserted by (user_id, legacy_index), and a
+user's array is only removed after all of its entries have been written. The
+(user_id, legacy_index) index only serves those upserts, so it is dropped once no
+user has an embedded array left.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from pymongo import UpdateOne
+from database import users_collection, transactions_collection, connect_mongo, create_indexes, index_name
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+LEGACY_INDEX = [("user_id", 1), ("legacy_index", 1)]
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+async def migrate_user(user: dict, dry_run: bool) -> int:
+    operations = []
+    for index, entry in enumerate(user.get("trade_history") or []):
+        operations.append(UpdateOne(
+            {"user_id": user["_id"], "legacy_index": index},
+            {"$setOnInsert": {
+                "user_id": user["_id"],
+                "legacy_index": index,
+                "action": entry["action"],
+                "symbol": entry["symbol"],
+                "quantity": entry["quantity"],
+                "timestamp": parse_timestamp(entry["timestamp"])
+            }},
+            upsert=True
+        ))
+
+    if dry_run:
+        return len(operations)
+
+    for i in range(0, len(operations), BATCH_SIZE):
+        await transactions_collection.bulk_write(operations[i:i + BATCH_SIZE], ordered=False)
+
+    await users_collection.update_one({"_id": user["_id"]}, {"$unset": {"trade_history": ""}})
+    return len(operations)
+
+
+async def migrate(dry_run: bool):
+    connect_mongo()
+    if not dry_run:
+        await create_indexes()
+        await transactions_collection.create_index(LEGACY_INDEX, sparse=True)
+
+    users = migrated = 0
+    cursor = users_collection.find({"trade_history": {"$exists": True}}, {"trade_history": 1})
+    async for user in cursor:
+        migrated += await migrate_user(user, dry_run)
+        users += 1
+        if users % 100 == 0:
+            logger.info(f"Processed {users} users, {migrated} trades")
+
+    action = "Would migrate" if dry_run else "Migrated"
+    logger.info(f"{action} {migrated} trades from {users} users")
+
+    # Not declared in database.INDEXES, so drop it once finished rather than leave check_indexes flagging it
+    if not dry_run and not await users_collection.count_documents({"trade_history": {"$exists": True}}, limit=1):
+        await transactions_collection.drop_index(index_name(LEGACY_INDEX))
+        logger.info(f"Dropped transactions.{index_name(LEGACY_INDEX)}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--dry-run", action="store_true", help="Count entries without writing")
+    asyncio.run(migrate(arg_parser.parse_args().dry_run))
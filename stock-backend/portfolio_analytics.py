@@ -0,0 +1,240 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import market_data
+from database import transactions_collection, portfolio_snapshots_collection
+from history_store import history_store, format_dates
+
+logger = logging.getLogger(__name__)
+
+# Trades younger than this are replayed for the response but not folded into the stored
+# snapshot, so a slow insert with a slightly earlier timestamp cannot land behind its cursor
+SNAPSHOT_SETTLE_SECONDS = 60
+
+SECONDS_PER_DAY = 86400
+
+_TRADE_FIELDS = {"symbol": 1, "action": 1, "quantity": 1, "price": 1, "timestamp": 1}
+
+
+def replay(positions: dict, trades: list) -> dict:
+    """Apply `trades` (oldest first, each with a price) to `positions` under average-cost accounting.
+
+    Every position is a dict of quantity, cost (remaining cost basis), realized P&L and
+    end-of-day steps of those three values. Buys add quantity * price to the cost basis;
+    sells realize quantity * (price - average cost) and take that average cost out of the
+    basis, which resets to zero on a full close. Each symbol is walked in trade order, so
+    long runs of partial sells cannot compound rounding error.
+    """
+    if not trades:
+        return positions
+
+    by_symbol = {}
+    for trade in trades:
+        by_symbol.setdefault(trade["symbol"], []).append(trade)
+
+    updated = dict(positions)
+    for symbol, rows in by_symbol.items():
+        previous = positions.get(symbol) or {}
+        held = float(previous.get("quantity", 0))
+        cost = float(previous.get("cost", 0.0))
+        realized = float(previous.get("realized", 0.0))
+        steps = {key: list(previous.get(key, [])) for key in ("days", "held", "costs", "realized_steps")}
+
+        for trade in rows:
+            quantity, price = trade["quantity"], trade["price"]
+            if trade["action"] == "buy":
+                held += quantity
+                cost += quantity * price
+            else:
+                average = cost / held if held > 0 else 0.0
+                realized += quantity * (price - average)
+                held -= quantity
+                cost = cost - quantity * average if held > 0 else 0.0
+
+            if steps["days"] and steps["days"][-1] == trade["day"]:
+                # Only the last trade of each day becomes that day's end-of-day step
+                for values in steps.values():
+                    values.pop()
+            steps["days"].append(trade["day"])
+            steps["held"].append(held)
+            steps["costs"].append(cost)
+            steps["realized_steps"].append(realized)
+
+        updated[symbol] = {
+            "symbol": symbol,
+            "quantity": int(round(held)),
+            "cost": cost,
+            "realized": realized,
+            **steps,
+        }
+    return updated
+
+
+async def _load_bars(symbols) -> dict:
+    """Daily bars per symbol; symbols whose history cannot be loaded get an empty array."""
+    async def load(symbol):
+        try:
+            return await history_store.get_bars(symbol, "1d")
+        except Exception as e:
+            logger.warning(f"No price history for {symbol}: {str(e)}")
+            return None
+
+    results = await asyncio.gather(*(load(symbol) for symbol in symbols))
+    return {symbol: bars for symbol, bars in zip(symbols, results) if bars is not None and len(bars)}
+
+
+def _close_on(bars, days):
+    """Close of the last bar on or before each day (the first bar's close for earlier days)."""
+    bar_days = bars["ts"] // SECONDS_PER_DAY
+    index = np.searchsorted(bar_days, days, side="right") - 1
+    return bars["close"][np.clip(index, 0, len(bars) - 1)]
+
+
+async def _price_trades(trades: list) -> int:
+    """Fill in prices for trades recorded before execution prices were stored; returns how many were estimated.
+
+    Trades whose symbol has no loadable history get today's quote (or 0.0) for this response
+    only and are flagged `provisional`, so they are never folded into the stored snapshot.
+    """
+    unpriced = [trade for trade in trades if trade.get("price") is None]
+    if not unpriced:
+        return 0
+
+    symbols = sorted({trade["symbol"] for trade in unpriced})
+    bars = await _load_bars(symbols)
+    for symbol in symbols:
+        rows = [trade for trade in unpriced if trade["symbol"] == symbol]
+        if symbol in bars:
+            closes = _close_on(bars[symbol], np.array([trade["day"] for trade in rows]))
+        else:
+            quote = (await market_data.get_quote(symbol)).quote or {}
+            closes = [quote.get("c") or 0.0] * len(rows)
+            for trade in rows:
+                trade["provisional"] = True
+        for trade, close in zip(rows, closes):
+            trade["price"] = float(close)
+    return len(unpriced)
+
+
+def equity_curve(positions: dict, bars: dict) -> list:
+    """Daily market value, cost basis and P&L from the first trade to the latest bar."""
+    stepped = [position for position in positions.values() if position.get("days")]
+    if not stepped:
+        return []
+
+    first_day = min(position["days"][0] for position in stepped)
+    all_days = [bars[position["symbol"]]["ts"] // SECONDS_PER_DAY for position in stepped if position["symbol"] in bars]
+    if not all_days:
+        return []
+    days = np.unique(np.concatenate(all_days))
+    days = days[days >= first_day]
+
+    value = np.zeros(len(days))
+    cost = np.zeros(len(days))
+    realized = np.zeros(len(days))
+    for position in stepped:
+        step = np.searchsorted(position["days"], days, side="right") - 1
+        known = step >= 0
+        step = np.clip(step, 0, None)
+        held = np.where(known, np.asarray(position["held"])[step], 0.0)
+        cost += np.where(known, np.asarray(position["costs"])[step], 0.0)
+        realized += np.where(known, np.asarray(position["realized_steps"])[step], 0.0)
+        if position["symbol"] in bars:
+            value += held * _close_on(bars[position["symbol"]], days)
+
+    dates = format_dates(days * SECONDS_PER_DAY)
+    pnl = value - cost + realized
+    return [
+        {
+            "date": date,
+            "market_value": round(float(v), 2),
+            "cost_basis": round(float(c), 2),
+            "realized_pnl": round(float(r), 2),
+            "total_pnl": round(float(p), 2),
+        }
+        for date, v, c, r, p in zip(dates, value, cost, realized, pnl)
+    ]
+
+
+async def get_analytics(user_id) -> dict:
+    """Cost basis, realized/unrealized P&L and a daily equity curve for a user.
+
+    Only trades newer than the stored snapshot's cursor are read and replayed; settled
+    ones up to the first provisionally priced trade are then folded into the snapshot.
+    """
+    snapshot = await portfolio_snapshots_collection.find_one({"_id": user_id}) or {}
+    positions = {position["symbol"]: position for position in snapshot.get("positions", [])}
+
+    query = {"user_id": user_id}
+    cursor = snapshot.get("cursor")
+    if cursor:
+        query["$or"] = [
+            {"timestamp": {"$gt": cursor["timestamp"]}},
+            {"timestamp": cursor["timestamp"], "_id": {"$gt": cursor["_id"]}},
+        ]
+    trades = await transactions_collection.find(query, _TRADE_FIELDS).sort([("timestamp", 1), ("_id", 1)]).to_list(None)
+    for trade in trades:
+        trade["day"] = int(trade["timestamp"].replace(tzinfo=timezone.utc).timestamp()) // SECONDS_PER_DAY
+    estimated = await _price_trades(trades)
+
+    settle_before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=SNAPSHOT_SETTLE_SECONDS)
+    settled = []
+    for trade in trades:
+        # Stop at the first trade priced from today's quote; it is re-priced once its history loads
+        if trade["timestamp"] >= settle_before or trade.get("provisional"):
+            break
+        settled.append(trade)
+    if settled:
+        positions = replay(positions, settled)
+        last = settled[-1]
+        await portfolio_snapshots_collection.replace_one(
+            {"_id": user_id},
+            {
+                "cursor": {"timestamp": last["timestamp"], "_id": last["_id"]},
+                "positions": list(positions.values()),
+                "updated_at": datetime.utcnow(),
+            },
+            upsert=True,
+        )
+    positions = replay(positions, trades[len(settled):])
+
+    held = [symbol for symbol, position in positions.items() if position["quantity"] > 0]
+    quotes, bars = await asyncio.gather(
+        asyncio.gather(*(market_data.get_quote(symbol) for symbol in held)),
+        _load_bars([symbol for symbol, position in positions.items() if position.get("days")]),
+    )
+    prices = {symbol: (result.quote or {}).get("c") for symbol, result in zip(held, quotes)}
+
+    rows = []
+    for symbol, position in sorted(positions.items()):
+        if not position["quantity"] and not position["realized"]:
+            continue
+        price = prices.get(symbol)
+        market_value = position["quantity"] * price if price else None
+        rows.append({
+            "symbol": symbol,
+            "quantity": position["quantity"],
+            "average_cost": round(position["cost"] / position["quantity"], 4) if position["quantity"] else None,
+            "cost_basis": round(position["cost"], 2),
+            "price": price,
+            "market_value": round(market_value, 2) if market_value is not None else None,
+            "unrealized_pnl": round(market_value - position["cost"], 2) if market_value is not None else None,
+            "realized_pnl": round(position["realized"], 2),
+        })
+
+    totals = {
+        "cost_basis": round(sum(row["cost_basis"] for row in rows), 2),
+        "market_value": round(sum(row["market_value"] or 0 for row in rows), 2),
+        "unrealized_pnl": round(sum(row["unrealized_pnl"] or 0 for row in rows), 2),
+        "realized_pnl": round(sum(row["realized_pnl"] for row in rows), 2),
+    }
+    totals["total_pnl"] = round(totals["unrealized_pnl"] + totals["realized_pnl"], 2)
+
+    return {
+        "positions": rows,
+        "totals": totals,
+        "equity_curve": equity_curve(positions, bars),
+        "trades_replayed": len(trades),
+        "estimated_prices": estimated,  # Older trades priced from that day's close
+    }
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from config import PUBSUB_PREFIX, PUBSUB_URL
+
+logger = logging.getLogger(__name__)
+
+# How long an elected tick producer keeps the role without renewing it, in seconds
+LEADER_TTL = 10
+# How long a worker's advertised symbol interest survives without a refresh, in seconds
+INTEREST_TTL = 10
+
+TICKS_CHANNEL = "ticks"
+
+# Identifies this process in leader election and interest keys
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class InMemoryPubSub:
+    """Single-process broker: every published message goes to this process's subscribers,
+    and the only worker is always the leader."""
+
+    def __init__(self):
+        self._subscribers = {}  # channel -> set of queues
+        self._interest = {}  # worker id -> (symbols, expiry)
+
+    async def publish(self, channel: str, message: str):
+        for queue in self._subscribers.get(channel, ()):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str):
+        """Yield messages published on `channel` until the consumer stops iterating."""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].discard(queue)
+
+    async def acquire_leadership(self, worker_id: str, ttl: float = LEADER_TTL) -> bool:
+        return True
+
+    async def release_leadership(self, worker_id: str):
+        pass
+
+    async def set_interest(self, worker_id: str, symbols, ttl: float = INTEREST_TTL):
+        self._interest[worker_id] = (set(symbols), time.monotonic() + ttl)
+
+    async def get_interest(self) -> set:
+        now = time.monotonic()
+        for worker_id, (_, expiry) in list(self._interest.items()):
+            if expiry < now:
+                del self._interest[worker_id]
+        return set().union(*(symbols for symbols, _ in self._interest.values()))
+
+    async def close(self):
+        pass
+
+
+# Extend the lock only if this worker still holds it
+_RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+# Delete the lock only if this worker still holds it
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisPubSub:
+    """Broker backed by a Redis-compatible server (Redis, Valkey, KeyDB, ...).
+
+    Messages go through PUBLISH/SUBSCRIBE. The tick producer is elected with a
+    `SET NX PX` lock that its holder renews while it works, so another worker takes
+    over within LEADER_TTL if it dies. Workers advertise the symbols their sockets watch
+    as fields of one hash, each value carrying its own expiry time.
+    """
+
+    def __init__(self, client, prefix: str = PUBSUB_PREFIX):
+        self.redis = client
+        self.prefix = prefix
+        self._leader_key = f"{prefix}:leader"
+        self._interest_key = f"{prefix}:interest"
+        self._renew = client.register_script(_RENEW_SCRIPT)
+        self._release = client.register_script(_RELEASE_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = PUBSUB_PREFIX):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("PUBSUB_URL is set but the redis package is not installed (pip install redis)")
+        return cls(redis.from_url(url, decode_responses=True), prefix)
+
+    def _channel(self, channel: str) -> str:
+        return f"{self.prefix}:{channel}"
+
+    async def publish(self, channel: str, message: str):
+        await self.redis.publish(self._channel(channel), message)
+
+    async def subscribe(self, channel: str):
+        """Yield messages published on `channel` until the consumer stops iterating."""
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self._channel(channel))
+        try:
+            while True:
+                message = await pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    yield message["data"]
+        finally:
+            await pubsub.aclose()
+
+    async def acquire_leadership(self, worker_id: str, ttl: float = LEADER_TTL) -> bool:
+        """Take the producer lock if it is free, or renew it if this worker already holds it."""
+        ttl_ms = int(ttl * 1000)
+        if await self.redis.set(self._leader_key, worker_id, nx=True, px=ttl_ms):
+            return True
+        return bool(await self._renew(keys=[self._leader_key], args=[worker_id, ttl_ms]))
+
+    async def release_leadership(self, worker_id: str):
+        await self._release(keys=[self._leader_key], args=[worker_id])
+
+    async def set_interest(self, worker_id: str, symbols, ttl: float = INTEREST_TTL):
+        entry = json.dumps({"symbols": sorted(symbols), "expires": time.time() + ttl})
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(self._interest_key, worker_id, entry)
+            # The whole hash goes once no worker is left refreshing it; a short-lived
+            # entry must not shorten the others' lifetime
+            pipe.pexpire(self._interest_key, int(max(ttl, INTEREST_TTL) * 2000))
+            await pipe.execute()
+
+    async def get_interest(self) -> set:
+        """Union of the symbols advertised by all live workers; entries of dead workers are dropped."""
+        now = time.time()
+        symbols, expired = set(), []
+        for worker_id, value in (await self.redis.hgetall(self._interest_key)).items():
+            entry = json.loads(value)
+            if entry["expires"] < now:
+                expired.append(worker_id)
+            else:
+                symbols.update(entry["symbols"])
+        if expired:
+            await self.redis.hdel(self._interest_key, *expired)
+        return symbols
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_broker():
+    if PUBSUB_URL:
+        logger.info(f"Using Redis pub/sub as worker {WORKER_ID}")
+        return RedisPubSub.from_url(PUBSUB_URL)
+    return InMemoryPubSub()
+
+
+broker = create_broker()
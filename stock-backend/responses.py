@@ -0,0 +1,33 @@
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# NumPy arrays and scalars, dict keys that aren't strings (e.g. ints) serialized natively
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    """Types orjson does not handle natively."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by orjson: datetimes, NumPy values and ObjectIds without a pure-Python pass.
+
+    Used as the app's default response class. Routes returning large payloads return it
+    directly, which also skips FastAPI's jsonable_encoder walk over the content.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
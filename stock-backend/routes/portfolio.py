@@ -1,26 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from auth import decode_access_token, oauth2_scheme
 from database import users_collection
 from bson import ObjectId
-import requests
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import asyncio
+import market_data
+from config import PORTFOLIO_QUOTE_CONCURRENCY
+from leaderboard import leaderboard, publish_position
+from user_cache import get_user, invalidate_user
+from responses import FastJSONResponse
 
 router = APIRouter()
 
-STOCK_API_KEY = os.getenv("STOCK_API_KEY")
-BASE_URL = "https://finnhub.io/api/v1"
-
 # Helper function to fetch stock logo
-def fetch_stock_logo(symbol):
-    try:
-        response = requests.get(f"{BASE_URL}/stock/profile2?symbol={symbol}&token={STOCK_API_KEY}")
-        if response.status_code == 200:
-            return response.json().get("logo", None)
-    except requests.exceptions.RequestException:
-        return None
+async def fetch_stock_logo(symbol):
+    return await market_data.fetch_stock_logo(symbol)
 
 from pydantic import BaseModel
 
@@ -34,7 +27,7 @@ class StockRequest(BaseModel):
 #     if not user_data:
 #         raise HTTPException(status_code=401, detail="Invalid token")
 
-#     logo_url = fetch_stock_logo(stock.symbol)
+#     logo_url = await fetch_stock_logo(stock.symbol)
 
 #     user_id = ObjectId(user_data["user_id"])
 #     await users_collection.update_one(
@@ -52,7 +45,7 @@ async def get_portfolio(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=401, detail="Invalid token")
 
     user_id = ObjectId(user_data["user_id"])
-    user = await users_collection.find_one({"_id": user_id}, {"portfolio": 1, "_id": 0})
+    user = await get_user(user_id)
 
     if not user or "portfolio" not in user:
         raise HTTPException(status_code=404, detail="Portfolio is empty")
@@ -90,9 +83,12 @@ async def update_portfolio(symbol: str, quantity: int, token: str = Depends(oaut
         {"$set": {"portfolio.$.quantity": quantity}}
     )
 
+    await invalidate_user(user_id)
+
     if update_result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Stock not found in portfolio")
 
+    await publish_position(user_id, symbol, quantity)
     return {"message": "Stock quantity updated"}
 
 # ✅ 5️⃣ Get real-time stock value in portfolio (Includes Logo)
@@ -103,7 +99,7 @@ async def get_portfolio_value(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=401, detail="Invalid token")
 
     user_id = ObjectId(user_data["user_id"])
-    user = await users_collection.find_one({"_id": user_id}, {"portfolio": 1, "_id": 0})
+    user = await get_user(user_id)
 
     if not user or "portfolio" not in user:
         raise HTTPException(status_code=404, detail="Portfolio is empty")
@@ -112,29 +108,78 @@ async def get_portfolio_value(token: str = Depends(oauth2_scheme)):
     total_value = 0
     stock_values = []
 
+    # Fetch every distinct symbol's quote concurrently with a bounded fan-out
+    semaphore = asyncio.Semaphore(PORTFOLIO_QUOTE_CONCURRENCY)
+
+    async def fetch(symbol):
+        async with semaphore:
+            # During an upstream outage, value with the last known price; price_age shows how old it is
+            return await market_data.get_quote(symbol, stale_ok=True)
+
+    symbols = list(dict.fromkeys(stock["symbol"] for stock in portfolio))
+    quotes = dict(zip(symbols, await asyncio.gather(*(fetch(symbol) for symbol in symbols))))
+
     for stock in portfolio:
         symbol = stock["symbol"]
         quantity = stock["quantity"]
         logo = stock.get("logo", None)
 
-        # Fetch stock price
-        try:
-            response = requests.get(f"{BASE_URL}/quote?symbol={symbol}&token={STOCK_API_KEY}")
-            if response.status_code == 200:
-                data = response.json()
-                stock_price = data.get("c", 0)  # 'c' is the current price
-
-                if stock_price:
-                    total_stock_value = stock_price * quantity
-                    total_value += total_stock_value
-                    stock_values.append({
-                        "symbol": symbol,
-                        "quantity": quantity,
-                        "price": stock_price,
-                        "total_value": total_stock_value,
-                        "logo": logo
-                    })
-        except requests.exceptions.RequestException:
+        result = quotes[symbol]
+        if not result.quote:
             continue
 
-    return {"total_portfolio_value": total_value, "stocks": stock_values}
+        stock_price = result.quote.get("c", 0)  # 'c' is the current price
+
+        if stock_price:
+            total_stock_value = stock_price * quantity
+            total_value += total_stock_value
+            stock_values.append({
+                "symbol": symbol,
+                "quantity": quantity,
+                "price": stock_price,
+                "total_value": total_stock_value,
+                "logo": logo,
+                "cached": result.cached,
+                "price_age": round(result.age, 3)
+            })
+
+    return FastJSONResponse({"total_portfolio_value": total_value, "stocks": stock_values})
+
+# ✅ 6️⃣ Cost basis, P&L and equity curve from trade history
+@router.get("/analytics")
+async def get_portfolio_analytics(token: str = Depends(oauth2_scheme)):
+    user_data = decode_access_token(token)
+    if not user_data:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    user_id = ObjectId(user_data["user_id"])
+    # ✅ Imported on first use so workers don't load NumPy before serving their first request
+    import portfolio_analytics
+
+    return FastJSONResponse(await portfolio_analytics.get_analytics(user_id))
+
+# Upper bound on leaderboard page size
+MAX_LEADERBOARD_LIMIT = 100
+
+# ✅ 7️⃣ Users ranked by portfolio value
+@router.get("/leaderboard")
+async def get_leaderboard(limit: int = Query(10, ge=1, le=MAX_LEADERBOARD_LIMIT), token: str = Depends(oauth2_scheme)):
+    user_data = decode_access_token(token)
+    if not user_data:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not leaderboard.ready:
+        raise HTTPException(status_code=503, detail="Leaderboard is still loading")
+
+    entries = leaderboard.top(limit)
+
+    # Users who joined since the last rebuild have no cached name yet
+    unnamed = [ObjectId(entry["user_id"]) for entry in entries if entry["username"] is None]
+    if unnamed:
+        async for user in users_collection.find({"_id": {"$in": unnamed}}, {"username": 1}):
+            leaderboard.names[str(user["_id"])] = user.get("username")
+        for entry in entries:
+            entry["username"] = leaderboard.names.get(entry["user_id"])
+
+    position = leaderboard.rank(user_data["user_id"])
+    me = {"rank": position[0], "value": position[1]} if position else None
+    return {"leaderboard": entries, "me": me, "users": len(leaderboard)}
@@ -1,90 +1,75 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-import os
+import asyncio
 import httpx
-from dotenv import load_dotenv
+import logging
+import time
 from database import stock_symbols_collection
-from pymongo import UpdateOne
-import requests
-import yfinance as yf
 from auth import oauth2_scheme
-
-load_dotenv()
+import market_data
+import symbol_sync
+from search_index import symbol_index
+from responses import FastJSONResponse
 
 router = APIRouter()
 
-STOCK_API_KEY = os.getenv("STOCK_API_KEY")
-BASE_URL = "https://finnhub.io/api/v1"
-
-@router.get("/{symbol}")
-async def get_stock(symbol: str):
-    """Fetch real-time stock data asynchronously."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{BASE_URL}/quote?symbol={symbol}&token={STOCK_API_KEY}")
-
-    if response.status_code == 200:
-        return response.json()
-    
-    raise HTTPException(status_code=404, detail="Stock not found")
+logger = logging.getLogger(__name__)
 
+YAHOO_SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
 
-@router.get("/symbols/update")
-async def fetch_and_store_stock_symbols(exchange: str = "US"):
-    """Fetch stock symbols from Finnhub, fetch their logos, and store only up to 100 entries in MongoDB."""
-    response = requests.get(f"{BASE_URL}/stock/symbol?exchange={exchange}&token={STOCK_API_KEY}")
+# Chart periods served from stored daily bars, in days
+HISTORY_PERIODS = {"5d": 5, "1mo": 30, "3mo": 91, "6mo": 182, "1y": 365}
 
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Failed to fetch stock symbols")
+# How old a cached quote /stocks/{symbol} may return
+QUOTE_MICRO_CACHE_AGE = 1.0
+# Upper bound on symbols per /stocks/quotes request
+MAX_BATCH_QUOTES = 50
 
-    stock_symbols = response.json()
+@router.get("/quotes")
+async def get_stock_quotes(symbols: str = Query(..., description="Comma-separated stock symbols")):
+    """Quotes for many symbols in one response; only symbols missing from the quote cache go upstream."""
+    symbols_list = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols.split(",") if symbol.strip()))
+    if not symbols_list:
+        raise HTTPException(status_code=400, detail="At least one symbol is required")
+    if len(symbols_list) > MAX_BATCH_QUOTES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUOTES} symbols per request")
 
-    if not stock_symbols:
-        raise HTTPException(status_code=404, detail="No stock symbols found")
+    results = await asyncio.gather(*(market_data.get_quote(symbol) for symbol in symbols_list))
+    return FastJSONResponse({
+        "quotes": {symbol: result.quote for symbol, result in zip(symbols_list, results) if result.quote},
+        "missing": [symbol for symbol, result in zip(symbols_list, results) if not result.quote],
+    })
 
-    # Limit to 100 entries
-    stock_symbols = stock_symbols[:100]
 
-    # Optional: Clear existing data to ensure only the latest 100 are stored
-    stock_symbols_collection.delete_many({"exchange": exchange})
-
-    bulk_operations = []
-    
-    for stock in stock_symbols:
-        symbol = stock["symbol"]
-
-        # Fetch company profile to get logo URL
-        profile_response = requests.get(f"{BASE_URL}/stock/profile2?symbol={symbol}&token={STOCK_API_KEY}")
-        logo_url = None
-        if profile_response.status_code == 200:
-            profile_data = profile_response.json()
-            logo_url = profile_data.get("logo", None)  # Get logo if available
+@router.get("/{symbol}")
+async def get_stock(symbol: str):
+    """Fetch real-time stock data asynchronously."""
+    # ✅ Identical concurrent requests share one upstream call and a ~1s micro-cache
+    quote = (await market_data.get_quote(symbol, QUOTE_MICRO_CACHE_AGE)).quote
+    if quote is None:
+        raise HTTPException(status_code=502, detail="Market data provider unavailable")
 
-        # Add logo URL to stock data
-        stock["logo"] = logo_url
+    return quote
 
-        # Prepare bulk update
-        bulk_operations.append(
-            UpdateOne(
-                {"symbol": symbol, "exchange": exchange},  # Match existing entry
-                {"$set": stock},  # Update fields
-                upsert=True  # Insert if not found
-            )
-        )
 
-    if bulk_operations:
-        stock_symbols_collection.bulk_write(bulk_operations)
+@router.get("/symbols/update", status_code=202)
+async def fetch_and_store_stock_symbols(exchange: str = "US"):
+    """Start a background sync of the exchange's full symbol list (with logos) into MongoDB."""
+    started = symbol_sync.start_symbol_sync(exchange)
+    message = "Stock symbol sync started" if started else "Stock symbol sync already running"
+    return {"message": message, "job": symbol_sync.get_sync_status()}
 
-    return {"message": "Stock symbols updated successfully with logos", "count": len(stock_symbols)}
 
+@router.get("/symbols/update/status")
+async def get_stock_symbols_sync_status():
+    """Report progress and run time of the current or last symbol sync."""
+    return symbol_sync.get_sync_status()
 
 
 @router.get("/get/symbols")
 async def get_stock_symbols(exchange: str = "US"):
     """Retrieve only up to 100 stored stock symbols from MongoDB asynchronously, with optimized fields."""
-    
-    # Ensure index on `exchange` for faster lookups
-    await stock_symbols_collection.create_index([("exchange", 1)])
 
-    # Fetch only necessary fields
+    # Fetch only necessary fields (served by the (exchange, symbol) index created at startup)
     symbols = await stock_symbols_collection.find(
         {"exchange": exchange}, 
         {"_id": 0, "symbol": 1, "exchange": 1, "description": 1, "type": 1}  # Fetch only required fields
@@ -93,67 +78,80 @@ async def get_stock_symbols(exchange: str = "US"):
     if not symbols:
         raise HTTPException(status_code=404, detail="Stock symbols not found, update first.")
 
-    return symbols
+    return FastJSONResponse(symbols)
 
 
 @router.get("/get/history")
-async def get_stock_history(symbol: str, token: str = Depends(oauth2_scheme)):
-    """Fetch historical stock data from Yahoo Finance."""
+async def get_stock_history(symbol: str, period: str = "1mo", token: str = Depends(oauth2_scheme)):
+    """Serve historical closes from the local history store, refreshing it incrementally when stale."""
     if not symbol:
         raise HTTPException(status_code=400, detail="Stock symbol is required.")
+    if period not in HISTORY_PERIODS:
+        raise HTTPException(status_code=400, detail=f"Unsupported period. Use one of: {', '.join(HISTORY_PERIODS)}")
 
-    try:
-        stock = yf.Ticker(symbol)
-        hist = stock.history(period="1mo")  # Fetch last 1 month
-        
-        if hist.empty:
-            raise HTTPException(status_code=404, detail="No stock data found. Try a different symbol.")
-        
-        chart_data = [
-            {"date": date.strftime("%Y-%m-%d"), "close": close}
-            for date, close in zip(hist.index, hist["Close"])
-        ]
-
-        return {"data": chart_data}
+    # ✅ Imported on first use: the history store pulls in NumPy (and yfinance on refresh)
+    from history_store import history_store, format_dates
 
+    try:
+        bars = await history_store.get_bars(symbol, "1d")
     except Exception as e:
-        print(f"Error fetching stock data: {str(e)}")  # Debugging
+        logger.error(f"Error fetching stock data: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Error fetching data: {str(e)}")
-    
 
+    # Bars are sorted by time, so the period start is a binary search away
+    since = time.time() - HISTORY_PERIODS[period] * 86400
+    bars = bars[bars["ts"].searchsorted(since):]
 
-@router.get("/get/search")
-async def search_stocks(query: str = Query(..., min_length=2)):
-    try:
-        url = f"https://query2.finance.yahoo.com/v1/finance/search?q={query}"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
+    if not len(bars):
+        raise HTTPException(status_code=404, detail="No stock data found. Try a different symbol.")
+
+    chart_data = [
+        {"date": date, "close": close}
+        for date, close in zip(format_dates(bars["ts"]), bars["close"].tolist())
+    ]
+
+    return FastJSONResponse({"data": chart_data})
+
+
+async def search_yahoo(query: str) -> list:
+    """Search Yahoo Finance for equities; used only when the local index has no hits."""
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
+    }
+    response = await market_data.upstream_get("yahoo", YAHOO_SEARCH_URL, params={"q": query}, headers=headers)
+    response.raise_for_status()  # Raises HTTPError for bad responses
+    
+    # Ensure the data structure is as expected
+    data = response.json()
+
+    # Check if 'quotes' exists and is a list
+    if "quotes" not in data or not isinstance(data["quotes"], list):
+        raise ValueError("Unexpected data structure received from Yahoo Finance API")
+
+    return [
+        {
+            "symbol": item.get("symbol", "N/A"),
+            "name": item.get("longname", item.get("shortname", "N/A")),  # Prefer longname, fallback to shortname
+            "exchange": item.get("exchDisp", "N/A")  # Display exchange information
         }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raises HTTPError for bad responses
-        
-        # Ensure the data structure is as expected
-        data = response.json()
-
-        # Check if 'quotes' exists and is a list
-        if "quotes" not in data or not isinstance(data["quotes"], list):
-            raise ValueError("Unexpected data structure received from Yahoo Finance API")
-
-        results = [
-            {
-                "symbol": item.get("symbol", "N/A"),
-                "name": item.get("longname", item.get("shortname", "N/A")),  # Prefer longname, fallback to shortname
-                "exchange": item.get("exchDisp", "N/A")  # Display exchange information
-            }
-            for item in data["quotes"]
-            if item.get("quoteType") == "EQUITY"  # Ensure the result is an EQUITY
-        ]
+        for item in data["quotes"]
+        if item.get("quoteType") == "EQUITY"  # Ensure the result is an EQUITY
+    ]
+
 
+@router.get("/get/search")
+async def search_stocks(query: str = Query(..., min_length=2), limit: int = Query(10, ge=1, le=50)):
+    """Search the local symbol index, falling back to Yahoo Finance when it has no hits."""
+    results = symbol_index.search(query, limit)
+    if results:
         return {"results": results}
+
+    try:
+        return {"results": await search_yahoo(query)}
     
-    except requests.exceptions.RequestException as req_err:
+    except httpx.HTTPError as req_err:
         raise HTTPException(status_code=500, detail=f"Request error: {str(req_err)}")
     except ValueError as val_err:
         raise HTTPException(status_code=500, detail=f"Value error: {str(val_err)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
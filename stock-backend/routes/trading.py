@@ -1,171 +1,425 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from auth import decode_access_token, oauth2_scheme
-from database import users_collection
+from database import users_collection, transactions_collection
 from bson import ObjectId
-import requests
-import os
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import asyncio
+import logging
 import time
-from datetime import datetime
-from dotenv import load_dotenv
+import base64
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
 from typing import List, Optional
 import httpx
 from datetime import datetime
 from dateutil import parser
-
-load_dotenv()
+import market_data
+from user_cache import invalidate_user
+from cache import RefreshingCache
+from leaderboard import publish_trade
+from responses import FastJSONResponse
+from config import NEWS_CACHE_TTL, NEWS_STALE_TTL, NEWSDATA_API_KEY as NEWS_API, TRADE_RECONCILE_SECONDS
+from config import EXECUTION_PRICE_MAX_AGE
 
 router = APIRouter()
 
-STOCK_API_KEY = os.getenv("STOCK_API_KEY")
-BASE_URL = "https://finnhub.io/api/v1"
+logger = logging.getLogger(__name__)
 
 class StockRequest(BaseModel):
     symbol: str
     quantity: int
 
+class TradeOrder(BaseModel):
+    symbol: str
+    quantity: int
+    action: str
+
+# Upper bound on orders accepted by a single /trades call
+MAX_BATCH_ORDERS = 100
+# Most recent order ids kept on the user document to confirm which batch orders applied
+RECENT_ORDER_IDS = 200
+# Trade history page size
+DEFAULT_HISTORY_LIMIT = 50
+MAX_HISTORY_LIMIT = 500
+
+
+def _append_order_id(order_id: ObjectId) -> dict:
+    """Aggregation expression appending `order_id` to the bounded recent_order_ids list."""
+    return {"$slice": [
+        {"$concatArrays": [{"$ifNull": ["$recent_order_ids", []]}, [{"$literal": order_id}]]},
+        -RECENT_ORDER_IDS
+    ]}
+
+
+def build_trade_update(transaction: dict):
+    """Build the (filter, pipeline) pair applying one trade to the position in a single atomic update.
+
+    Sells only match while the position holds enough shares, so a sell that would go
+    negative matches nothing instead of racing a separate read. The same update queues
+    `transaction` in the user's pending_transactions outbox, so the history entry is
+    written together with the position and can be recovered if the request dies before
+    record_transactions() copies it to the transactions collection.
+    """
+    user_id, action, symbol, quantity = (transaction[key] for key in ("user_id", "action", "symbol", "quantity"))
+    portfolio = {"$ifNull": ["$portfolio", []]}  # Ensure portfolio is an array
+    is_symbol = {"$eq": ["$$item.symbol", {"$literal": symbol}]}
+
+    if action == "buy":
+        update_filter = {"_id": user_id}
+        new_portfolio = {
+            "$cond": [
+                {"$in": [{"$literal": symbol}, {"$ifNull": ["$portfolio.symbol", []]}]},
+                {
+                    "$map": {
+                        "input": portfolio,
+                        "as": "item",
+                        "in": {
+                            "$cond": [
+                                is_symbol,
+                                {"$mergeObjects": ["$$item", {"quantity": {"$add": ["$$item.quantity", quantity]}}]},
+                                "$$item"
+                            ]
+                        }
+                    }
+                },
+                {"$concatArrays": [portfolio, [{"$literal": {"symbol": symbol, "quantity": quantity}}]]}
+            ]
+        }
+    else:
+        update_filter = {"_id": user_id, "portfolio": {"$elemMatch": {"symbol": symbol, "quantity": {"$gte": quantity}}}}
+        new_portfolio = {
+            # Decrement the position and drop it once it reaches zero
+            "$filter": {
+                "input": {
+                    "$map": {
+                        "input": portfolio,
+                        "as": "item",
+                        "in": {
+                            "$cond": [
+                                is_symbol,
+                                {"$mergeObjects": ["$$item", {"quantity": {"$subtract": ["$$item.quantity", quantity]}}]},
+                                "$$item"
+                            ]
+                        }
+                    }
+                },
+                "as": "item",
+                "cond": {"$gt": ["$$item.quantity", 0]}
+            }
+        }
+
+    return update_filter, [{"$set": {
+        "portfolio": new_portfolio,
+        "recent_order_ids": _append_order_id(transaction["_id"]),
+        "pending_transactions": {"$concatArrays": [
+            {"$ifNull": ["$pending_transactions", []]}, [{"$literal": transaction}]
+        ]},
+    }}]
+
+
+def build_transaction(order_id: ObjectId, user_id: ObjectId, action: str, symbol: str, quantity: int, timestamp: datetime, price: Optional[float] = None) -> dict:
+    return {
+        "_id": order_id,
+        "user_id": user_id,
+        "action": action,
+        "symbol": symbol,
+        "quantity": quantity,
+        "price": price,  # Execution price, used for cost basis and P&L
+        "timestamp": timestamp
+    }
+
+
+async def record_transactions(user_id: ObjectId, transactions: List[dict]):
+    """Copy trades from the user's outbox into the transactions collection, then clear them from it.
+
+    Trades are keyed by order id, so one already recorded by an earlier attempt is a
+    duplicate key and skipped; history is never written twice.
+    """
+    if not transactions:
+        return
+    try:
+        await transactions_collection.insert_many(transactions, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+    await users_collection.update_one(
+        {"_id": user_id},
+        {"$pull": {"pending_transactions": {"_id": {"$in": [transaction["_id"] for transaction in transactions]}}}}
+    )
+
+
+async def record_filled(user_id: ObjectId, transactions: List[dict]):
+    """record_transactions for trades that already filled: a failure is logged, not raised,
+    since the trades are safe in the outbox and reconcile_loop records them later."""
+    try:
+        await record_transactions(user_id, transactions)
+    except Exception as e:
+        logger.error(f"Recording {len(transactions)} trades for {user_id} failed, left for reconciliation: {str(e)}")
+
+
+async def reconcile_pending_transactions(min_age: float = TRADE_RECONCILE_SECONDS) -> int:
+    """Record outbox entries older than `min_age` seconds left behind by requests that died mid-trade."""
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+    recovered = 0
+    # Served by the sparse pending_transactions.timestamp index, so only users with a backlog are read
+    async for user in users_collection.find(
+        {"pending_transactions.timestamp": {"$lt": cutoff}}, {"pending_transactions": 1}
+    ):
+        stranded = [transaction for transaction in user["pending_transactions"] if transaction["timestamp"] < cutoff]
+        await record_transactions(user["_id"], stranded)
+        recovered += len(stranded)
+    if recovered:
+        logger.warning(f"Recorded {recovered} trades left in pending_transactions")
+    return recovered
+
+
+async def reconcile_loop():
+    """Periodically recover stranded trades; started with the app."""
+    while True:
+        try:
+            await reconcile_pending_transactions()
+        except Exception as e:
+            logger.error(f"Trade reconciliation failed: {str(e)}")
+        await asyncio.sleep(TRADE_RECONCILE_SECONDS)
+
+
+async def fetch_execution_price(symbol: str) -> Optional[float]:
+    """Price a trade fills at: a recent cached quote, else a fresh one (the last known price if
+    the provider is failing), or None if the symbol has never been quoted."""
+    quote = (await market_data.get_quote(symbol, max_age=EXECUTION_PRICE_MAX_AGE, stale_ok=True)).quote
+    return quote.get("c") if quote else None
+
+
+def validate_order(symbol: str, quantity: int, action: str) -> str:
+    action = action.lower()
+    if action not in ["buy", "sell"]:
+        raise HTTPException(status_code=400, detail="Invalid action. Use 'buy' or 'sell'.")
+    if not symbol:
+        raise HTTPException(status_code=400, detail="Stock symbol is required.")
+    if quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive.")
+    return action
+
+
+def sell_error(portfolio: List[dict], symbol: str, quantity: int) -> Optional[HTTPException]:
+    """Why `portfolio` cannot cover selling `quantity` of `symbol`, or None if it can."""
+    if not portfolio:
+        return HTTPException(status_code=404, detail="Portfolio is empty")
+
+    stock_entry = next((item for item in portfolio if item["symbol"] == symbol), None)
+    if not stock_entry:
+        return HTTPException(status_code=400, detail="Stock not found in portfolio")
+    if stock_entry["quantity"] < quantity:
+        return HTTPException(status_code=400,
+            detail=f"Not enough shares. You have {stock_entry['quantity']} of {symbol}")
+    return None
+
+
+async def read_portfolio(user_id: ObjectId) -> List[dict]:
+    user = await users_collection.find_one({"_id": user_id}, {"portfolio": 1, "_id": 0})
+    return (user or {}).get("portfolio") or []
+
+
+async def explain_failed_sell(user_id: ObjectId, symbol: str, quantity: int):
+    """Work out why a conditional sell matched nothing (only read on the failure path)."""
+    error = sell_error(await read_portfolio(user_id), symbol, quantity)
+    if error:
+        raise error
+    # The position covered the sell again by the time it was re-read
+    raise HTTPException(status_code=409, detail="Position changed during the trade, please retry")
 
 
 # ✅ Simulated Buy/Sell Trading with Trade History
 @router.post("/trade")
 async def trade_stock(stock: StockRequest, action: str = Query(..., description="buy/sell"), token: str = Depends(oauth2_scheme)):
-    """Buy/Sell stocks with proper quantity aggregation"""
+    """Buy/Sell stocks with one conditional atomic position update that also queues the trade record"""
     user_data = decode_access_token(token)
     if not user_data:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    if action.lower() not in ["buy", "sell"]:
-        raise HTTPException(status_code=400, detail="Invalid action. Use 'buy' or 'sell'.")
-
+    action = validate_order(stock.symbol, stock.quantity, action)
     user_id = ObjectId(user_data["user_id"])
-    user = await users_collection.find_one({"_id": user_id}, {"portfolio": 1, "trade_history": 1, "_id": 0})
-    timestamp = datetime.utcnow().isoformat()
-
-    if action.lower() == "buy":
-        # ✅ Updated Buy Logic
-        await users_collection.update_one(
-            {"_id": user_id},
-            [
-                {
-                    "$set": {
-                        "portfolio": {
-                            "$cond": [
-                                {
-                                    "$in": [
-                                        stock.symbol,
-                                        {"$ifNull": ["$portfolio.symbol", []]}  # Ensure it's an array
-                                    ]
-                                },
-                                {
-                                    "$map": {
-                                        "input": {"$ifNull": ["$portfolio", []]},  # Ensure portfolio is an array
-                                        "as": "item",
-                                        "in": {
-                                            "$cond": [
-                                                {"$eq": ["$$item.symbol", stock.symbol]},
-                                                {
-                                                    "symbol": "$$item.symbol",
-                                                    "quantity": {"$add": ["$$item.quantity", stock.quantity]}
-                                                },
-                                                "$$item"
-                                            ]
-                                        }
-                                    }
-                                },
-                                {
-                                    "$concatArrays": [
-                                        {"$ifNull": ["$portfolio", []]},  # Ensure portfolio is an array
-                                        [{"symbol": stock.symbol, "quantity": stock.quantity}]
-                                    ]
-                                }
-                            ]
-                        }
-                    }
-                }
-            ]
-        )
+    price = await fetch_execution_price(stock.symbol)
+    transaction = build_transaction(ObjectId(), user_id, action, stock.symbol, stock.quantity, datetime.utcnow(), price)
+
+    update_filter, pipeline = build_trade_update(transaction)
+    result = await users_collection.update_one(update_filter, pipeline)
+
+    if result.modified_count:
+        await invalidate_user(user_id)
 
+    if result.matched_count == 0:
+        if action == "sell":
+            await explain_failed_sell(user_id, stock.symbol, stock.quantity)
+        raise HTTPException(status_code=404, detail="User not found")
 
-        # Log trade history
-        await users_collection.update_one(
-            {"_id": user_id},
-            {"$push": {"trade_history": {
-                "action": "buy",
-                "symbol": stock.symbol,
-                "quantity": stock.quantity,
-                "timestamp": timestamp
-            }}}
-        )
+    await record_filled(user_id, [transaction])
+    await publish_trade(user_id, stock.symbol, stock.quantity if action == "buy" else -stock.quantity)
 
+    if action == "buy":
         return {"message": f"Bought {stock.quantity} of {stock.symbol}"}
+    return {"message": f"Sold {stock.quantity} of {stock.symbol}"}
+
+
+# ✅ Batch Buy/Sell in one bulk write
+@router.post("/trades")
+async def trade_stocks(orders: List[TradeOrder], token: str = Depends(oauth2_scheme)):
+    """Apply a list of orders in submission order with a single ordered bulk_write.
+
+    Sells that lack shares at their point in the sequence are rejected; the rest still apply.
+    Orders the current position already rules out are rejected before any price is fetched.
+    """
+    user_data = decode_access_token(token)
+    if not user_data:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    if not orders:
+        raise HTTPException(status_code=400, detail="No orders submitted")
+    if len(orders) > MAX_BATCH_ORDERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ORDERS} orders per batch")
 
-    elif action.lower() == "sell":
-        if not user or "portfolio" not in user:
-            raise HTTPException(status_code=404, detail="Portfolio is empty")
-
-        # Find aggregated stock entry
-        stock_entry = next(
-            (item for item in user["portfolio"] if item["symbol"] == stock.symbol),
-            None
-        )
-
-        if not stock_entry:
-            raise HTTPException(status_code=400, detail="Stock not found in portfolio")
-
-        if stock_entry["quantity"] < stock.quantity:
-            raise HTTPException(status_code=400, 
-                detail=f"Not enough shares. You have {stock_entry['quantity']} of {stock.symbol}")
-
-        new_quantity = stock_entry["quantity"] - stock.quantity
-
-        # Update portfolio
-        if new_quantity == 0:
-            await users_collection.update_one(
-                {"_id": user_id},
-                {"$pull": {"portfolio": {"symbol": stock.symbol}}}
-            )
-        else:
-            await users_collection.update_one(
-                {"_id": user_id, "portfolio.symbol": stock.symbol},
-                {"$set": {"portfolio.$.quantity": new_quantity}}
-            )
-
-        # Log trade history
-        await users_collection.update_one(
-            {"_id": user_id},
-            {"$push": {"trade_history": {
-                "action": "sell",
-                "symbol": stock.symbol,
-                "quantity": stock.quantity,
-                "timestamp": timestamp
-            }}}
-        )
-
-        return {"message": f"Sold {stock.quantity} of {stock.symbol}"}
+    actions = [validate_order(order.symbol, order.quantity, order.action) for order in orders]
+    user_id = ObjectId(user_data["user_id"])
+    order_ids = [ObjectId() for _ in orders]
+
+    # Walk the orders over the current position to find the sells it cannot cover
+    held = {item["symbol"]: item["quantity"] for item in await read_portfolio(user_id)}
+    accepted = []
+    for order, action, order_id in zip(orders, actions, order_ids):
+        change = order.quantity if action == "buy" else -order.quantity
+        if held.get(order.symbol, 0) + change < 0:
+            continue
+        held[order.symbol] = held.get(order.symbol, 0) + change
+        accepted.append((order, action, order_id))
+
+    symbols = list(dict.fromkeys(order.symbol for order, _, _ in accepted))
+    prices = dict(zip(symbols, await asyncio.gather(*(fetch_execution_price(symbol) for symbol in symbols))))
+
+    timestamp = datetime.utcnow()
+    queued = [
+        build_transaction(order_id, user_id, action, order.symbol, order.quantity, timestamp, prices[order.symbol])
+        for order, action, order_id in accepted
+    ]
+    operations = [UpdateOne(*build_trade_update(transaction)) for transaction in queued]
+    result = await users_collection.bulk_write(operations, ordered=True) if operations else None
+
+    if result and result.modified_count:
+        await invalidate_user(user_id)
+
+    if result is None:
+        filled = set()
+    elif result.matched_count == len(operations):
+        filled = {transaction["_id"] for transaction in queued}
+    else:
+        # Some conditional sells matched nothing: read back which orders were applied
+        user = await users_collection.find_one({"_id": user_id}, {"_id": 0, "recent_order_ids": 1})
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        filled = {transaction["_id"] for transaction in queued} & set(user.get("recent_order_ids", []))
+
+    transactions = [transaction for transaction in queued if transaction["_id"] in filled]
+    if transactions:
+        await record_filled(user_id, transactions)
+        for transaction in transactions:
+            quantity = transaction["quantity"]
+            await publish_trade(user_id, transaction["symbol"], quantity if transaction["action"] == "buy" else -quantity)
+
+    results = [
+        {
+            "order_id": str(order_id),
+            "symbol": order.symbol,
+            "action": action,
+            "quantity": order.quantity,
+            "status": "filled" if order_id in filled else "rejected"
+        }
+        for order, action, order_id in zip(orders, actions, order_ids)
+    ]
+    return {"filled": len(filled), "rejected": len(orders) - len(filled), "results": results}
         
         
+def encode_cursor(transaction: dict) -> str:
+    """Opaque keyset cursor pointing just past `transaction` in (timestamp, _id) descending order."""
+    timestamp_ms = int(transaction["timestamp"].replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return base64.urlsafe_b64encode(f"{timestamp_ms}:{transaction['_id']}".encode()).decode()
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Normalize a query datetime to the naive UTC form stored in MongoDB."""
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp_ms, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        timestamp = datetime.fromtimestamp(int(timestamp_ms) / 1000, tz=timezone.utc).replace(tzinfo=None)
+        return timestamp, ObjectId(transaction_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 # ✅ Get Trade History
 @router.get("/trade/history")
-async def get_trade_history(token: str = Depends(oauth2_scheme)):
-    """Fetch user's trade history."""
+async def get_trade_history(
+    limit: int = Query(DEFAULT_HISTORY_LIMIT, ge=1, le=MAX_HISTORY_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    symbol: Optional[str] = None,
+    start: Optional[datetime] = Query(None, description="Only trades at or after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only trades before this time (UTC)"),
+    token: str = Depends(oauth2_scheme)
+):
+    """Fetch a page of the user's trade history, newest first, using keyset pagination."""
     user_data = decode_access_token(token)
     if not user_data:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user_id = ObjectId(user_data["user_id"])
-    user = await users_collection.find_one({"_id": user_id}, {"trade_history": 1, "_id": 0})
-
-    if not user or "trade_history" not in user:
-        return {"trade_history": []}
-
-    return {"trade_history": user["trade_history"]}
+    query = {"user_id": ObjectId(user_data["user_id"])}
+    if symbol:
+        query["symbol"] = symbol
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = to_utc_naive(start)
+        if end:
+            query["timestamp"]["$lt"] = to_utc_naive(end)
+    if cursor:
+        after_timestamp, after_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$lt": after_timestamp}},
+            {"timestamp": after_timestamp, "_id": {"$lt": after_id}}
+        ]
+
+    # Served by the (user_id, timestamp, _id) / (user_id, symbol, timestamp, _id) indexes
+    transactions = await transactions_collection.find(query).sort(
+        [("timestamp", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = encode_cursor(transactions[limit - 1]) if len(transactions) > limit else None
+    trade_history = [
+        {
+            "order_id": str(transaction["_id"]),
+            "action": transaction["action"],
+            "symbol": transaction["symbol"],
+            "quantity": transaction["quantity"],
+            "price": transaction.get("price"),
+            "timestamp": transaction["timestamp"]  # orjson writes the same ISO 8601 string
+        }
+        for transaction in transactions[:limit]
+    ]
+
+    # ✅ Rendered directly by orjson, skipping FastAPI's per-field jsonable_encoder pass
+    return FastJSONResponse({"trade_history": trade_history, "next_cursor": next_cursor})
 
 # ✅ 3️⃣ Get Trending Stocks
 @router.get("/trending")
 async def get_trending_stocks(token: str = Depends(oauth2_scheme)):
     """Fetch trending stocks from Finnhub."""
-    url = f"{BASE_URL}/stock/symbol?exchange=US&token={STOCK_API_KEY}"
-    response = requests.get(url)
+    try:
+        response = await market_data.finnhub_get("/stock/symbol", exchange="US")
+    except httpx.HTTPError:
+        raise HTTPException(status_code=400, detail="Failed to fetch trending stocks")
 
     if response.status_code == 200:
         stock_data = response.json()
@@ -175,7 +429,9 @@ async def get_trending_stocks(token: str = Depends(oauth2_scheme)):
     raise HTTPException(status_code=400, detail="Failed to fetch trending stocks")
 
 
-NEWS_API = os.getenv("NEWSDATA_API_KEY")
+NEWS_CACHE_SIZE = 256
+
+news_cache = RefreshingCache(NEWS_CACHE_SIZE, NEWS_CACHE_TTL, NEWS_STALE_TTL)
 
 class NewsArticle(BaseModel):
     title: str
@@ -191,42 +447,53 @@ def sanitize_description(desc) -> str:
         return desc.strip()
     return "No description available"
 
-@router.get("/api/news", response_model=List[NewsArticle])
+async def fetch_news(query: str) -> List[dict]:
+    """Fetch and validate business news whose titles mention any of the given symbols; returns plain dicts."""
+    response = await market_data.upstream_get(
+        "newsdata",
+        "https://newsdata.io/api/1/news",
+        params={
+            "apikey": NEWS_API,
+            "qInTitle": query,
+            "language": "en",
+            "category": "business"
+        }
+    )
+    response.raise_for_status()
+    news_data = response.json()
+
+    articles = []
+    for article in news_data.get("results", []):
+        # ✅ Ensure description is a string before passing to Pydantic
+        clean_description = sanitize_description(article.get("description"))
+
+        try:
+            articles.append(NewsArticle(
+                title=str(article.get("title", "No Title Available")),  # Ensure title is a string
+                link=str(article.get("link", "#")),  # Ensure link is a string
+                description=clean_description,  # Now always a valid string
+                pubDate=datetime.fromisoformat(article["pubDate"]),
+                source=str(article.get("source_id", "Unknown")),  # Ensure source is a string
+                image_url=article.get("image_url")
+            ).model_dump())
+        except Exception as e:
+            logger.warning(f"Skipping invalid article: {e}")  # Log error but don't crash
+
+    return articles
+
+# Articles are validated once in fetch_news(); declaring the schema under `responses` documents it
+# without FastAPI validating every cached article again on each request
+@router.get("/api/news", responses={200: {"model": List[NewsArticle]}})
 async def get_news(symbols: str = Query(..., description="Comma-separated stock symbols")):
-    symbols_list = symbols.split(',')
+    # ✅ Same key for "AAPL,MSFT" and "msft, aapl" so dashboards share one cached entry
+    symbols_list = sorted({symbol.strip().upper() for symbol in symbols.split(',') if symbol.strip()})
+    if not symbols_list:
+        raise HTTPException(status_code=400, detail="At least one symbol is required")
+    query = ",".join(symbols_list)
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://newsdata.io/api/1/news",
-                params={
-                    "apikey": NEWS_API,
-                    "qInTitle": ",".join(symbols_list),
-                    "language": "en",
-                    "category": "business"
-                }
-            )
-            response.raise_for_status()
-            news_data = response.json()
-
-            articles = []
-            for article in news_data.get("results", []):
-                # ✅ Ensure description is a string before passing to Pydantic
-                clean_description = sanitize_description(article.get("description"))
-
-                try:
-                    articles.append(NewsArticle(
-                        title=str(article.get("title", "No Title Available")),  # Ensure title is a string
-                        link=str(article.get("link", "#")),  # Ensure link is a string
-                        description=clean_description,  # Now always a valid string
-                        pubDate=datetime.fromisoformat(article["pubDate"]),
-                        source=str(article.get("source_id", "Unknown")),  # Ensure source is a string
-                        image_url=article.get("image_url")
-                    ))
-                except Exception as e:
-                    print(f"⚠️ Skipping invalid article: {e}")  # Log error but don't crash
-
-            return articles
+        # Cached articles are already validated, so hits skip parsing the upstream payload
+        return FastJSONResponse(await news_cache.get(query, lambda: fetch_news(query)))
 
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=502, detail=f"News API error: {str(e)}")
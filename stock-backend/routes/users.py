@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from database import users_collection
-from auth import hash_password, verify_password, create_access_token, oauth2_scheme, decode_access_token
+from auth import hash_password_async, verify_and_update_password, create_access_token, oauth2_scheme, decode_access_token
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from user_cache import get_user
 
 router = APIRouter()
 
@@ -22,18 +24,30 @@ async def register_user(user: UserRegister):
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
     
-    hashed_pwd = hash_password(user.password)
+    hashed_pwd = await hash_password_async(user.password)
     new_user = {"username": user.username, "email": user.email, "password": hashed_pwd}
-    result = await users_collection.insert_one(new_user)
+    try:
+        result = await users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        # ✅ A concurrent sign-up with the same email won the race; the unique index rejects this one
+        raise HTTPException(status_code=400, detail="User already exists")
 
     return {"message": "User registered successfully", "id": str(result.inserted_id)}
 
 @router.post("/login")
 async def login_user(user: UserLogin):
     db_user = await users_collection.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["password"]):
+    if not db_user:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+
+    valid, new_hash = await verify_and_update_password(user.password, db_user["password"])
+    if not valid:
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
+    # Rehash with the current cost factor when BCRYPT_ROUNDS has changed
+    if new_hash:
+        await users_collection.update_one({"_id": db_user["_id"]}, {"$set": {"password": new_hash}})
+
     token = create_access_token({"user_id": str(db_user["_id"]), "email": db_user["email"]})
     return {"access_token": token, "token_type": "bearer"}
 
@@ -43,7 +57,7 @@ async def get_user_profile(token: str = Depends(oauth2_scheme)):
     if not user_data:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = await users_collection.find_one({"_id": ObjectId(user_data["user_id"])}, {"password": 0})
+    user = await get_user(ObjectId(user_data["user_id"]))
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
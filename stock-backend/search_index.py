@@ -0,0 +1,262 @@
+import asyncio
+import bisect
+import json
+import logging
+import re
+from collections import Counter
+from database import stock_symbols_collection
+from pubsub import WORKER_ID, broker
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[A-Z0-9]+")
+
+# Rank tiers: lower sorts first
+EXACT, SYMBOL_PREFIX, NAME_PREFIX, FUZZY = range(4)
+
+# Minimum trigram Jaccard similarity for a fuzzy term match
+FUZZY_THRESHOLD = 0.4
+
+# Each in-place insert shifts the sorted lists (O(n)); an upsert batch larger than
+# 1/REBUILD_RATIO of the index is merged with one rebuild instead
+REBUILD_RATIO = 8
+
+# Symbol sync changes are broadcast here so every worker's index follows, not just the syncing one's
+SYMBOLS_CHANNEL = "symbols"
+
+
+def _words(text: str) -> list:
+    return _WORD_RE.findall((text or "").upper())
+
+
+def _trigrams(word: str) -> set:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SymbolSearchIndex:
+    """In-memory symbol/description search with sorted-key prefix lookups and a trigram fallback."""
+
+    def __init__(self):
+        self._docs = {}  # symbol -> {"symbol", "name", "exchange"}
+        self._symbols = []  # sorted symbols
+        self._words = []  # sorted (word, symbol) pairs from descriptions
+        self._terms = {}  # distinct symbol/description term -> reference count
+        self._trigrams = {}  # trigram -> set of terms
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, symbol):
+        return symbol in self._docs
+
+    def name(self, symbol: str) -> str:
+        doc = self._docs.get(symbol)
+        return doc["name"] if doc else symbol
+
+    def _add_term(self, term: str):
+        count = self._terms.get(term, 0)
+        self._terms[term] = count + 1
+        if count == 0:
+            for trigram in _trigrams(term):
+                self._trigrams.setdefault(trigram, set()).add(term)
+
+    def _drop_term(self, term: str):
+        count = self._terms.get(term, 0) - 1
+        if count > 0:
+            self._terms[term] = count
+            return
+        self._terms.pop(term, None)
+        for trigram in _trigrams(term):
+            holders = self._trigrams.get(trigram)
+            if holders is not None:
+                holders.discard(term)
+                if not holders:
+                    del self._trigrams[trigram]
+
+    @staticmethod
+    def _doc_terms(doc: dict) -> set:
+        return set(_words(doc["name"])) | {doc["symbol"].upper()}
+
+    @staticmethod
+    def _make_doc(raw: dict) -> dict:
+        return {
+            "symbol": raw["symbol"],
+            "name": raw.get("description") or raw["symbol"],
+            "exchange": raw.get("exchange", "N/A"),
+        }
+
+    def build(self, raw_docs):
+        """Replace the whole index from stock_symbols documents."""
+        self._build(self._make_doc(raw) for raw in raw_docs)
+
+    def _build(self, docs):
+        self._docs = {}
+        self._terms = {}
+        self._trigrams = {}
+        words = []
+        for doc in docs:
+            symbol = doc["symbol"]
+            self._docs[symbol] = doc
+            words.extend((word, symbol) for word in set(_words(doc["name"])))
+            for term in self._doc_terms(doc):
+                self._add_term(term)
+
+        self._symbols = sorted(self._docs)
+        self._words = sorted(words)
+
+    def remove(self, symbols):
+        """Drop symbols from the index in place."""
+        for symbol in symbols:
+            doc = self._docs.pop(symbol, None)
+            if doc is None:
+                continue
+
+            i = bisect.bisect_left(self._symbols, symbol)
+            if i < len(self._symbols) and self._symbols[i] == symbol:
+                del self._symbols[i]
+
+            for word in set(_words(doc["name"])):
+                i = bisect.bisect_left(self._words, (word, symbol))
+                if i < len(self._words) and self._words[i] == (word, symbol):
+                    del self._words[i]
+            for term in self._doc_terms(doc):
+                self._drop_term(term)
+
+    async def upsert(self, raw_docs):
+        """Add or replace documents: small batches in place, large ones (e.g. a first sync) by
+        building a merged index in a worker thread and swapping it in."""
+        docs = [self._make_doc(raw) for raw in raw_docs]
+        if len(docs) * REBUILD_RATIO > len(self._docs):
+            merged = dict(self._docs)
+            merged.update((doc["symbol"], doc) for doc in docs)
+            fresh = SymbolSearchIndex()
+            await asyncio.to_thread(fresh._build, list(merged.values()))
+            for name in ("_docs", "_symbols", "_words", "_terms", "_trigrams"):
+                setattr(self, name, getattr(fresh, name))
+            return
+
+        for doc in docs:
+            symbol = doc["symbol"]
+            if symbol in self._docs:
+                self.remove([symbol])
+
+            self._docs[symbol] = doc
+            bisect.insort(self._symbols, symbol)
+            for word in set(_words(doc["name"])):
+                bisect.insort(self._words, (word, symbol))
+            for term in self._doc_terms(doc):
+                self._add_term(term)
+
+    def _prefix_range(self, keys: list, prefix, limit: int):
+        i = bisect.bisect_left(keys, prefix)
+        stop = min(len(keys), i + limit)
+        while i < stop:
+            yield keys[i]
+            i += 1
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Return up to `limit` documents ranked exact > symbol prefix > name prefix > fuzzy."""
+        query = query.strip().upper()
+        tokens = _words(query)
+        if not tokens:
+            return []
+
+        scan = limit * 20
+        ranked = {}
+
+        def add(symbol, tier, weight=0.0):
+            rank = (tier, weight, len(symbol), symbol)
+            if symbol not in ranked or rank < ranked[symbol]:
+                ranked[symbol] = rank
+
+        if query in self._docs:
+            add(query, EXACT)
+
+        for symbol in self._prefix_range(self._symbols, query, scan):
+            if not symbol.startswith(query):
+                break
+            add(symbol, SYMBOL_PREFIX)
+
+        # Every query token must prefix some word of the description
+        first, rest = tokens[0], tokens[1:]
+        for word, symbol in self._prefix_range(self._words, (first,), scan):
+            if not word.startswith(first):
+                break
+            if rest:
+                name_words = _words(self._docs[symbol]["name"])
+                if not all(any(w.startswith(token) for w in name_words) for token in rest):
+                    continue
+            add(symbol, NAME_PREFIX)
+
+        if not ranked:
+            # Fuzzy-match each query token against the term vocabulary, then map terms to symbols
+            for token in tokens:
+                grams = _trigrams(token)
+                counts = Counter()
+                for gram in grams:
+                    counts.update(self._trigrams.get(gram, ()))
+                for term, hits in counts.most_common(scan):
+                    similarity = hits / (len(grams) + len(_trigrams(term)) - hits)
+                    if similarity < FUZZY_THRESHOLD:
+                        continue
+                    if term in self._docs:
+                        add(term, FUZZY, -similarity)
+                    for word, symbol in self._prefix_range(self._words, (term,), scan):
+                        if word != term:
+                            break
+                        add(symbol, FUZZY, -similarity)
+
+        best = sorted(ranked.values())[:limit]
+        return [self._docs[rank[3]] for rank in best]
+
+
+symbol_index = SymbolSearchIndex()
+
+
+async def load_search_index():
+    """Build the in-memory index from every stored stock symbol."""
+    try:
+        docs = await stock_symbols_collection.find(
+            {}, {"_id": 0, "symbol": 1, "description": 1, "exchange": 1}
+        ).to_list(None)
+    except Exception as e:
+        logger.error(f"Failed to load search index: {str(e)}")
+        return
+
+    symbol_index.build(docs)
+    logger.info(f"Search index loaded with {len(symbol_index)} symbols")
+
+
+async def publish_symbol_changes(upserted: list, removed: list):
+    """Tell the other workers' indexes what a sync changed. A batch big enough to force a
+    rebuild is sent as a reload from the database rather than as documents."""
+    if not upserted and not removed:
+        return
+    if (len(upserted) + len(removed)) * REBUILD_RATIO > len(symbol_index):
+        change = {"reload": True}
+    else:
+        fields = ("symbol", "description", "exchange")
+        change = {"upserted": [{key: raw.get(key) for key in fields} for raw in upserted], "removed": list(removed)}
+    try:
+        await broker.publish(SYMBOLS_CHANNEL, json.dumps({**change, "source": WORKER_ID}))
+    except Exception as e:
+        logger.error(f"Failed to broadcast symbol changes: {str(e)}")
+
+
+async def follow_symbol_changes():
+    """Apply symbol changes synced by other workers; started with the app."""
+    while True:
+        try:
+            async for message in broker.subscribe(SYMBOLS_CHANNEL):
+                change = json.loads(message)
+                if change["source"] == WORKER_ID:
+                    continue
+                if change.get("reload"):
+                    await load_search_index()
+                    continue
+                await symbol_index.upsert(change["upserted"])
+                symbol_index.remove(change["removed"])
+        except Exception as e:
+            logger.error(f"Symbol index change feed error: {str(e)}")
+            await asyncio.sleep(1)
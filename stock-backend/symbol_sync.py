@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from config import (
+    SYMBOL_SYNC_CHUNK_SIZE as SYNC_CHUNK_SIZE,
+    SYMBOL_SYNC_LOGO_CONCURRENCY as LOGO_CONCURRENCY,
+    SYMBOL_SYNC_LOGO_LIMIT as LOGO_LIMIT,
+)
+from database import stock_symbols_collection
+import market_data
+from search_index import publish_symbol_changes, symbol_index
+
+logger = logging.getLogger(__name__)
+
+# Symbols whose profile had no logo are not retried before this
+LOGO_RECHECK_AFTER = timedelta(days=30)
+
+sync_state = {"status": "idle"}
+_sync_task = None
+_sync_started = None
+
+
+def _changed(existing: dict, fields: dict) -> bool:
+    return existing is None or any(existing.get(key) != value for key, value in fields.items())
+
+
+def _needs_logo(existing: dict, recheck_before: datetime) -> bool:
+    if not existing:
+        return True
+    if existing.get("logo"):
+        return False
+    checked_at = existing.get("logo_checked_at")
+    return checked_at is None or checked_at < recheck_before
+
+
+async def _flush(operations: list):
+    if operations:
+        await stock_symbols_collection.bulk_write(operations, ordered=False)
+        operations.clear()
+
+
+async def _enrich_logos(exchange: str, symbols: list):
+    """Fetch missing logos concurrently and store them in chunked bulk writes."""
+    semaphore = asyncio.Semaphore(LOGO_CONCURRENCY)
+    operations = []
+
+    async def fetch(symbol):
+        async with semaphore:
+            return symbol, await market_data.fetch_stock_logo(symbol)
+
+    for next_result in asyncio.as_completed([fetch(symbol) for symbol in symbols]):
+        symbol, logo = await next_result
+        operations.append(UpdateOne(
+            {"symbol": symbol, "exchange": exchange},
+            {"$set": {"logo": logo, "logo_checked_at": datetime.utcnow()}}
+        ))
+        sync_state["logos_checked"] += 1
+        if logo:
+            sync_state["logos_found"] += 1
+        if len(operations) >= SYNC_CHUNK_SIZE:
+            await _flush(operations)
+
+    await _flush(operations)
+
+
+async def run_symbol_sync(exchange: str = "US"):
+    """Stream the exchange's symbol list, upsert only changed rows and enrich missing logos."""
+    global _sync_started
+    started = _sync_started = time.monotonic()
+    sync_state.clear()
+    sync_state.update({
+        "status": "running",
+        "phase": "loading",
+        "exchange": exchange,
+        "started_at": datetime.utcnow().isoformat(),
+        "received": 0,
+        "upserted": 0,
+        "unchanged": 0,
+        "removed": 0,
+        "logos_pending": 0,
+        "logos_checked": 0,
+        "logos_found": 0,
+    })
+
+    try:
+        existing = {}
+        async for doc in stock_symbols_collection.find({"exchange": exchange}, {"_id": 0}):
+            existing[doc["symbol"]] = doc
+
+        sync_state["phase"] = "diffing"
+        operations = []
+        changed_docs = []
+        seen = set()
+        async for stock in market_data.stream_finnhub_array("/stock/symbol", exchange=exchange):
+            symbol = stock.get("symbol")
+            if not symbol:
+                continue
+
+            seen.add(symbol)
+            sync_state["received"] += 1
+            fields = {key: value for key, value in stock.items() if key != "logo"}
+            fields["exchange"] = exchange
+
+            if not _changed(existing.get(symbol), fields):
+                sync_state["unchanged"] += 1
+                continue
+
+            operations.append(UpdateOne({"symbol": symbol, "exchange": exchange}, {"$set": fields}, upsert=True))
+            changed_docs.append(fields)
+            sync_state["upserted"] += 1
+            if len(operations) >= SYNC_CHUNK_SIZE:
+                await _flush(operations)
+
+        await _flush(operations)
+        # One index update per sync, so a first sync is a single build rather than a row-by-row insert
+        await symbol_index.upsert(changed_docs)
+        await publish_symbol_changes(changed_docs, [])
+
+        # Only prune after a complete listing, never after a partial stream, and never
+        # on an empty one: that is far likelier an upstream fault than a delisted exchange
+        if not seen and existing:
+            raise ValueError(f"Upstream listed no symbols for {exchange}; keeping the {len(existing)} stored")
+        removed = list(set(existing) - seen)
+        for i in range(0, len(removed), SYNC_CHUNK_SIZE):
+            await stock_symbols_collection.delete_many(
+                {"exchange": exchange, "symbol": {"$in": removed[i:i + SYNC_CHUNK_SIZE]}}
+            )
+        symbol_index.remove(removed)
+        await publish_symbol_changes([], removed)
+        sync_state["removed"] = len(removed)
+
+        sync_state["phase"] = "logos"
+        recheck_before = datetime.utcnow() - LOGO_RECHECK_AFTER
+        missing_logos = [symbol for symbol in seen if _needs_logo(existing.get(symbol), recheck_before)][:LOGO_LIMIT]
+        sync_state["logos_pending"] = len(missing_logos)
+        await _enrich_logos(exchange, missing_logos)
+
+        sync_state["status"] = "completed"
+    except Exception as e:
+        logger.exception(f"Symbol sync for {exchange} failed")
+        sync_state["status"] = "failed"
+        sync_state["error"] = str(e)
+    finally:
+        sync_state.pop("phase", None)
+        sync_state["finished_at"] = datetime.utcnow().isoformat()
+        sync_state["duration_seconds"] = round(time.monotonic() - started, 3)
+        logger.info(f"Symbol sync finished: {sync_state}")
+
+
+def start_symbol_sync(exchange: str = "US") -> bool:
+    """Start a background sync unless one is already running; returns True when started."""
+    global _sync_task
+    if _sync_task is not None and not _sync_task.done():
+        return False
+    sync_state.clear()
+    sync_state.update({"status": "queued", "exchange": exchange})
+    _sync_task = asyncio.create_task(run_symbol_sync(exchange))
+    return True
+
+
+def get_sync_status() -> dict:
+    """Snapshot of the current or last sync, with elapsed time while running."""
+    status = dict(sync_state)
+    if status["status"] == "running":
+        status["elapsed_seconds"] = round(time.monotonic() - _sync_started, 3)
+    return status
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import websockets
+import market_data
+from config import FINNHUB_WS_URL
+
+logger = logging.getLogger(__name__)
+
+# Reconnect backoff bounds, in seconds
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+# Seconds between pushes of coalesced stream prices into the shared quote cache
+FLUSH_INTERVAL = 1.0
+
+
+class TradeStreamIngester:
+    """Keeps one upstream trade-feed connection subscribed to the symbols that have local viewers.
+
+    Trades are coalesced into the latest price per symbol; the emitter reads them once
+    per fan-out interval, and the quote cache and its listeners see them once per
+    FLUSH_INTERVAL rather than once per trade.
+    """
+
+    def __init__(self, url: str = FINNHUB_WS_URL, token: str = market_data.STOCK_API_KEY):
+        self.url = url
+        self.token = token
+        self.connected = False
+        self.prices = {}  # symbol -> (price, monotonic receive time)
+        self.volumes = {}  # symbol -> traded volume seen on the stream
+        self._pending = {}  # symbol -> [latest price, volume] not yet pushed to the quote cache
+        self._wanted = set()
+        self._subscribed = set()
+        self._websocket = None
+        self._task = None
+        self._flush_task = None
+        self._lock = asyncio.Lock()  # Serializes subscription changes on the socket
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        for task in (self._task, self._flush_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._flush_task = None
+        self.flush()
+
+    async def set_symbols(self, symbols):
+        """Follow exactly `symbols` upstream, subscribing and unsubscribing the difference."""
+        self._wanted = set(symbols)
+        if self.connected:
+            await self._sync_subscriptions()
+
+    async def _sync_subscriptions(self):
+        async with self._lock:
+            websocket = self._websocket
+            if websocket is None:
+                return
+            for symbol in self._wanted - self._subscribed:
+                await websocket.send(json.dumps({"type": "subscribe", "symbol": symbol}))
+                self._subscribed.add(symbol)
+            for symbol in self._subscribed - self._wanted:
+                await websocket.send(json.dumps({"type": "unsubscribe", "symbol": symbol}))
+                self._subscribed.discard(symbol)
+                self.prices.pop(symbol, None)
+                self._pending.pop(symbol, None)
+
+    def latest(self, symbol: str):
+        """Latest streamed price for a symbol, or None if no trade has been seen."""
+        entry = self.prices.get(symbol)
+        return entry[0] if entry else None
+
+    def _ingest(self, message: str):
+        payload = json.loads(message)
+        if payload.get("type") != "trade":
+            return  # pings and subscription acks
+
+        received = time.monotonic()
+        for trade in payload.get("data") or []:
+            symbol = trade.get("s")
+            price = trade.get("p")
+            if symbol not in self._subscribed or price is None:
+                continue  # Includes trades still in flight after an unsubscribe
+            # Later trades in a burst simply overwrite earlier ones
+            self.prices[symbol] = (price, received)
+            volume = trade.get("v") or 0
+            self.volumes[symbol] = self.volumes.get(symbol, 0) + volume
+            pending = self._pending.get(symbol)
+            if pending is None:
+                self._pending[symbol] = [price, volume]
+            else:
+                pending[0] = price
+                pending[1] += volume
+
+    def flush(self):
+        """Push each symbol's latest price and the volume traded since the last flush to the quote cache."""
+        pending, self._pending = self._pending, {}
+        for symbol, (price, volume) in pending.items():
+            market_data.record_price(symbol, price, volume)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Trade stream flush failed: {str(e)}")
+
+    async def run(self):
+        """Connect, resubscribe and ingest until cancelled, reconnecting with jittered exponential backoff."""
+        delay = RECONNECT_MIN_DELAY
+        url = f"{self.url}?token={self.token}" if self.token else self.url
+
+        while True:
+            try:
+                async with websockets.connect(url) as websocket:
+                    self._websocket = websocket
+                    self._subscribed = set()
+                    self.connected = True
+                    logger.info(f"Trade stream connected, following {len(self._wanted)} symbols")
+                    await self._sync_subscriptions()
+                    delay = RECONNECT_MIN_DELAY
+
+                    async for message in websocket:
+                        self._ingest(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Trade stream error: {str(e)}")
+            finally:
+                self.connected = False
+                self._websocket = None
+                self._subscribed = set()
+
+            wait = delay * (0.5 + random.random())
+            logger.info(f"Reconnecting trade stream in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+trade_stream = TradeStreamIngester()
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+from bson import ObjectId
+from cache import TTLCache
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from database import users_collection
+from pubsub import WORKER_ID, broker
+
+logger = logging.getLogger(__name__)
+
+# Profile projection shared by /users/user/me, /portfolio/ and /portfolio/value
+USER_PROJECTION = {"password": 0, "recent_order_ids": 0, "pending_transactions": 0}
+
+# Invalidations are broadcast here so every worker drops its copy, not just the writer's
+USERS_CHANNEL = "users"
+
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# Bumped on every invalidation so a read that raced a write is not cached. A version only
+# has to outlive the reads in flight when it was bumped, so old ones expire like cache entries.
+_versions = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def _version(key: str) -> int:
+    version = _versions.get(key)
+    return 0 if version is TTLCache.MISSING else version
+
+
+async def get_user(user_id: ObjectId):
+    """Read-through lookup of a user's profile/portfolio projection; returns a shallow copy."""
+    key = str(user_id)
+    user = user_cache.get(key)
+    if user is TTLCache.MISSING:
+        version = _version(key)
+        user = await users_collection.find_one({"_id": user_id}, USER_PROJECTION)
+        if user is None:
+            return None
+        if _version(key) == version:
+            user_cache.set(key, user)
+    return dict(user)
+
+
+def _drop(key: str):
+    _versions.set(key, _version(key) + 1)
+    user_cache.invalidate(key)
+
+
+async def invalidate_user(user_id: ObjectId):
+    """Drop a user's cached entry after a write to their document, on every worker."""
+    key = str(user_id)
+    _drop(key)
+    try:
+        await broker.publish(USERS_CHANNEL, json.dumps({"user": key, "source": WORKER_ID}))
+    except Exception as e:
+        logger.error(f"Failed to broadcast cache invalidation: {str(e)}")
+
+
+async def follow_invalidations():
+    """Drop entries invalidated by other workers; started with the app."""
+    while True:
+        try:
+            async for message in broker.subscribe(USERS_CHANNEL):
+                change = json.loads(message)
+                if change["source"] != WORKER_ID:
+                    _drop(change["user"])
+        except Exception as e:
+            logger.error(f"User cache invalidation feed error: {str(e)}")
+            await asyncio.sleep(1)
@@ -1,6 +1,6 @@
 "use client";
 
-import { useQuery } from "@tanstack/react-query";
+import { useInfiniteQuery, useQuery } from "@tanstack/react-query";
 import { Card } from "@/components/ui/card";
 import { Skeleton } from "@/components/ui/skeleton";
 import { Button } from "@/components/ui/button";
@@ -16,12 +16,18 @@ interface UserData {
     symbol: string;
     quantity: number;
   }>;
+}
+
+interface TradeHistoryPage {
   trade_history: Array<{
+    order_id: string;
     action: string;
     symbol: string;
     quantity: number;
+    price: number | null;
     timestamp: string;
   }>;
+  next_cursor: string | null;
 }
 
 export default function SettingsPage() {
@@ -42,6 +48,32 @@ export default function SettingsPage() {
     retry: 1,
   });
 
+  // Trades live in their own collection now; page through them newest first
+  const {
+    data: historyData,
+    isLoading: isHistoryLoading,
+    isError: isHistoryError,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery<TradeHistoryPage>({
+    queryKey: ["tradeHistoryPages"],
+    queryFn: async ({ pageParam }) => {
+      const token = getAuthToken();
+      if (!token) throw new Error("Not authenticated");
+      const response = await axios.get("https://stock-project-1.onrender.com/trading/trade/history", {
+        headers: { Authorization: `Bearer ${token}` },
+        params: pageParam ? { cursor: pageParam } : {},
+      });
+      return response.data;
+    },
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.next_cursor,
+    enabled: isAuthenticated,
+    retry: 1,
+  });
+  const tradeHistory = historyData?.pages.flatMap((page) => page.trade_history) ?? [];
+
   if (isError) {
     return (
       <Layout>
@@ -112,8 +144,8 @@ export default function SettingsPage() {
                   </tr>
                 </thead>
                 <tbody className="divide-y divide-border">
-                  {userData.trade_history.map((trade, index) => (
-                    <tr key={index} className="hover:bg-muted/25 transition-colors">
+                  {tradeHistory.map((trade) => (
+                    <tr key={trade.order_id} className="hover:bg-muted/25 transition-colors">
                       <td className="px-4 py-3">
                         <span className={`inline-flex items-center px-2.5 py-0.5 rounded-full text-xs font-medium ${
                           trade.action === 'buy' 
@@ -138,7 +170,21 @@ export default function SettingsPage() {
                   ))}
                 </tbody>
               </table>
+              {isHistoryLoading && <Skeleton className="h-[200px] w-full mt-4" />}
+              {isHistoryError && (
+                <p className="mt-4 text-sm text-muted-foreground">Could not load trade history.</p>
+              )}
+              {!isHistoryLoading && !isHistoryError && tradeHistory.length === 0 && (
+                <p className="mt-4 text-sm text-muted-foreground">No trades yet.</p>
+              )}
             </div>
+            {hasNextPage && (
+              <div className="mt-4 flex justify-center">
+                <Button variant="outline" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                  {isFetchingNextPage ? "Loading..." : "Load more"}
+                </Button>
+              </div>
+            )}
           </Card>
         </>
       ) : (